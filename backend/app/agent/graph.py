@@ -3,7 +3,10 @@ LangGraph Agent - Payment Operations State Machine
 Implements the Observe → Reason → Decide → Act → Learn loop
 """
 
-from typing import TypedDict, Annotated, Literal, List, Optional
+from typing import TypedDict, Annotated, Literal, List, Optional, Deque
+from types import MappingProxyType
+from collections import deque
+from itertools import islice
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 import google.generativeai as genai
@@ -11,10 +14,14 @@ from datetime import datetime
 import asyncio
 import json
 import os
+import orjson
+import structlog
 from dotenv import load_dotenv
 
 from app.agent.tools import PaymentOpsTools
-from app.agent.guardrails import Guardrails
+from app.agent.guardrails import (
+    Guardrails, SWITCH_GATEWAY, ADJUST_RETRY_CONFIG, INCREASE_MONITORING, SEND_ALERT
+)
 from app.models.schemas import (
     Anomaly, 
     Intervention, 
@@ -25,6 +32,8 @@ from app.models.schemas import (
 
 load_dotenv()
 
+logger = structlog.get_logger()
+
 # Configure Gemini
 genai.configure(api_key=os.getenv("GEMINI_API_KEY", ""))
 
@@ -34,6 +43,7 @@ class AgentState(TypedDict):
     # Current observations
     metrics: dict
     anomalies: List[dict]
+    anomaly_severities: List[str]  # Parallel to the detected anomalies
     bank_health: List[dict]
     error_logs: List[dict]
     
@@ -61,6 +71,21 @@ class PaymentOpsAgent:
     Implements a continuous observe → reason → decide → act → learn loop.
     """
     
+    # Scalar defaults for each loop iteration's AgentState; the mutable
+    # containers are filled in fresh per iteration
+    _INITIAL_STATE_TEMPLATE = MappingProxyType({
+        "hypothesis": "",
+        "risk_score": 0.0,
+        "intervention": None,
+        "requires_approval": False,
+        "outcome": None,
+        "should_remember": False,
+        "iteration": 0,
+        "should_continue": True
+    })
+    
+    MAX_INTERVENTION_HISTORY = 500
+    
     def __init__(self, redis_service, ws_manager, simulator_service=None, ml_service=None):
         self.redis = redis_service
         self.ws = ws_manager
@@ -73,9 +98,23 @@ class PaymentOpsAgent:
         
         # Runtime state
         self.pending_interventions: dict = {}
-        self.intervention_history: List[Intervention] = []
+        # Bounded so a long-running agent doesn't grow this forever
+        self.intervention_history: Deque[Intervention] = deque(maxlen=self.MAX_INTERVENTION_HISTORY)
         self.is_running = False
         
+        # Loop scheduling: tick every poll_interval, or earlier when an
+        # anomalous metrics sample arrives (never more often than min_interval)
+        self.poll_interval = 5.0
+        self.min_interval = 1.0
+        self.max_backoff = 60.0
+        self._wake = asyncio.Event()
+        
+        # Thought frames waiting to be broadcast; the graph never blocks on
+        # slow WebSocket clients, it drops the oldest frame instead
+        self._out_queue: asyncio.Queue = asyncio.Queue(maxsize=64)
+        if redis_service is not None:
+            redis_service.metrics_listeners.append(self._on_metrics)
+        
     def _build_graph(self) -> StateGraph:
         """Build the LangGraph state machine"""
         
@@ -126,19 +165,22 @@ class PaymentOpsAgent:
         )
         await self._broadcast_thought(thought)
         
-        # Get current metrics
-        metrics = await self.tools.get_current_metrics()
-        print(f"  📊 Observed metrics: success={metrics.get('success_rate')}, latency={metrics.get('avg_latency')}, errors={metrics.get('error_rate')}")
-        
-        # Get bank health
-        bank_health = await self.tools.get_bank_status()
-        
-        # Get recent error logs
-        error_logs = await self.tools.get_error_logs(limit=100)
-        
-        # Run anomaly detection
-        anomalies = await self.tools.detect_anomalies(metrics)
-        print(f"  🔍 Anomalies detected: {len(anomalies)} - {[a.get('type') for a in anomalies]}")
+        self.tools.begin_tick()
+        try:
+            # Get current metrics and run anomaly detection in one pass
+            metrics, anomalies = await self.tools.observe_and_detect()
+            logger.debug("  📊 Observed metrics: success=%s, latency=%s, errors=%s", metrics.get('success_rate'), metrics.get('avg_latency'), metrics.get('error_rate'))
+            logger.debug("  🔍 Anomalies detected: %d - %s", len(anomalies), [a.get('type') for a in anomalies])
+            
+            # Get bank health
+            bank_health = self.tools.get_bank_status_sync()
+            if bank_health is None:
+                bank_health = await self.tools.get_bank_status()
+            
+            # Get recent error logs
+            error_logs = await self.tools.get_error_logs(limit=100)
+        finally:
+            self.tools.end_tick()
         
         observe_thought = AgentThought(
             timestamp=datetime.now().isoformat(),
@@ -154,6 +196,7 @@ class PaymentOpsAgent:
             "bank_health": bank_health,
             "error_logs": error_logs,
             "anomalies": anomalies,
+            "anomaly_severities": [a["severity"] for a in anomalies],
             "iteration": state.get("iteration", 0) + 1
         }
     
@@ -187,12 +230,12 @@ class PaymentOpsAgent:
                 # Format for prompt
                 risk_desc = [f"{k}: {v['risk']:.0%} ({v['reason']})" for k, v in high_risk.items()]
                 state["anomalies"].append(f"ML High Risk Alert: {', '.join(risk_desc)}")
-                print(f"  🤖 ML Model predicts failure for: {risk_desc}")
+                logger.info("  🤖 ML Model predicts failure for: %s", risk_desc)
 
             # Retrieve past memories for similar patterns
             memories = await self.tools.recall_similar_patterns({"anomalies": state["anomalies"]})
             if memories:
-                print(f"  🧠 Recalled {len(memories)} past relevant interventions")
+                logger.info("  🧠 Recalled %d past relevant interventions", len(memories))
                 # Format memories for context
                 memory_context = [
                     f"Past Action: {m.get('intervention', {}).get('description')} -> Result: {m.get('outcome')} (Improvement: {m.get('improvement', 0):.1f}%)"
@@ -231,12 +274,12 @@ Respond in JSON format:
 }}"""
 
             try:
-                print(f"  🤖 Calling Gemini API...")
+                logger.debug("  🤖 Calling Gemini API...")
                 response = await asyncio.wait_for(
                     asyncio.to_thread(self.model.generate_content, prompt),
                     timeout=30.0
                 )
-                print(f"  ✅ Gemini response received")
+                logger.debug("  ✅ Gemini response received")
                 
                 # Parse response
                 result_text = response.text
@@ -257,7 +300,7 @@ Respond in JSON format:
                     max_ml_risk = max([v.get("risk", 0.0) for v in predictions.values()]) if predictions else 0.0
                     
                     if max_ml_risk > 0.6:  # Threshold for ML influence
-                        print(f"  🤖 ML overriding risk score: {risk_score} -> {max(risk_score, max_ml_risk)}")
+                        logger.info("  🤖 ML overriding risk score: %s -> %s", risk_score, max(risk_score, max_ml_risk))
                         risk_score = max(risk_score, max_ml_risk)
                         if "ML" not in hypothesis:
                             try:
@@ -282,7 +325,7 @@ Respond in JSON format:
                 }
             
             except asyncio.TimeoutError:
-                print(f"  ⚠️ Gemini API timeout - using fallback")
+                logger.warning("  ⚠️ Gemini API timeout - using fallback")
                 fallback_thought = AgentThought(
                     timestamp=datetime.now().isoformat(),
                     stage="reason",
@@ -296,7 +339,7 @@ Respond in JSON format:
                     "thoughts": [{"role": "system", "content": "Timeout - fallback reasoning"}]
                 }
             except Exception as e:
-                print(f"  ⚠️ Gemini API error: {e}")
+                logger.warning("  ⚠️ Gemini API error: %s", e)
                 fallback_thought = AgentThought(
                     timestamp=datetime.now().isoformat(),
                     stage="reason",
@@ -335,28 +378,28 @@ Respond in JSON format:
             {
                 "id": "monitor",
                 "type": "monitor",
-                "action": "increase_monitoring", 
+                "action": INCREASE_MONITORING, 
                 "description": "Increase monitoring frequency",
                 "params": {}
             },
             {
                 "id": "retry",
                 "type": "retry", 
-                "action": "adjust_retry_config",
+                "action": ADJUST_RETRY_CONFIG,
                 "description": "Increase retry attempts",
                 "params": {"max_retries": 5, "backoff_multiplier": 1.5}
             },
             {
                 "id": "switch_gateway",
                 "type": "reroute",
-                "action": "switch_gateway",
+                "action": SWITCH_GATEWAY,
                 "description": "Switch Gateway (Reroute Traffic)",
                 "params": self._identify_problematic_bank(state)
             },
             {
                 "id": "alert",
                 "type": "alert",
-                "action": "send_alert",
+                "action": SEND_ALERT,
                 "description": "Send Escalation Alert",
                 "params": {"message": f"Critical Risk {state['risk_score']:.2f}", "severity": "critical"}
             }
@@ -395,7 +438,7 @@ Respond in JSON format:
         if not best_action:
             best_action = candidate_actions[0]
 
-        print(f"  ⚖️ Policy Decision: {', '.join(decision_log)}")
+        logger.info("  ⚖️ Policy Decision: %s", ', '.join(decision_log))
         
         intervention = {
             "type": best_action["type"],
@@ -427,7 +470,7 @@ Respond in JSON format:
                     break
         
         if is_duplicate:
-            print(f"  ⚠️ Skipping duplicate intervention: {intervention['description']}")
+            logger.info("  ⚠️ Skipping duplicate intervention: %s", intervention['description'])
             intervention = {
                 "type": "monitor",
                 "action": "continue_monitoring",
@@ -471,22 +514,22 @@ Respond in JSON format:
         
         success = False
         
-        if action == "switch_gateway":
+        if action == SWITCH_GATEWAY:
             success = await self.tools.switch_gateway(
                 from_bank=params.get("from"),
                 to_bank=params.get("to"),
                 percentage=params.get("percentage", 100)
             )
-        elif action == "adjust_retry_config":
+        elif action == ADJUST_RETRY_CONFIG:
             success = await self.tools.adjust_retry_config(
                 max_retries=params.get("max_retries", 5),
                 backoff_multiplier=params.get("backoff_multiplier", 1.5)
             )
-        elif action == "increase_monitoring":
+        elif action == INCREASE_MONITORING:
             success = True  # Always succeeds
         elif action == "continue_monitoring":
             success = True
-        elif action == "send_alert":
+        elif action == SEND_ALERT:
             success = await self.tools.send_alert(
                 message=params.get("message", "Alert from Payment Agent"),
                 severity=params.get("severity", "warning")
@@ -565,7 +608,7 @@ Respond in JSON format:
             if not outcome.get("success"):
                 reward -= 50
                 
-            print(f"  💰 Reward Calc: Gain={success_gain:.1f}, LatPen={latency_penalty:.1f}, Cost={action_cost} -> R={reward:.1f}")
+            logger.info("  💰 Reward Calc: Gain=%.1f, LatPen=%.1f, Cost=%s -> R=%.1f", success_gain, latency_penalty, action_cost, reward)
             
             # --- Update Policy ---
             if self.tools.ml and intervention.get("policy_context"):
@@ -614,7 +657,7 @@ Respond in JSON format:
                             "hypothesis": pending.get("hypothesis")
                         }
                     })
-                    print(f"  📣 Broadcasted approval request: {int_id}")
+                    logger.info("  📣 Broadcasted approval request: %s", int_id)
         
         return {
             "should_remember": outcome.get("success", False) if outcome else False,
@@ -648,7 +691,7 @@ Respond in JSON format:
             "hypothesis": state["hypothesis"]
         }
         
-        print(f"  ⏳ Intervention requires approval: {intervention_id}")
+        logger.info("  ⏳ Intervention requires approval: %s", intervention_id)
         
         return "pending_approval"
     
@@ -706,7 +749,7 @@ Respond in JSON format:
         
         # If the best alternative is also performing poorly (e.g. < 80%), don't switch
         if highest_rate < 80:
-            print(f"  ⚠️ No healthy alternative found (best is {best_alternative} at {highest_rate}%). Suggesting alert instead.")
+            logger.warning("  ⚠️ No healthy alternative found (best is %s at %s%%). Suggesting alert instead.", best_alternative, highest_rate)
             # Fallback to alert/monitor instead of a bad switch
             return {
                 "from": worst_bank or "HDFC",
@@ -726,7 +769,8 @@ Respond in JSON format:
     
     async def _broadcast_thought(self, thought: AgentThought):
         """Broadcast agent thought to connected clients"""
-        await self.ws.broadcast({
+        # Encode once here rather than once per client in the manager
+        payload = orjson.dumps({
             "type": "thought",
             "data": {
                 "timestamp": thought.timestamp,
@@ -734,52 +778,86 @@ Respond in JSON format:
                 "content": thought.content
             }
         })
+        try:
+            self._out_queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self._out_queue.get_nowait()
+            self._out_queue.put_nowait(payload)
+    
+    async def _broadcaster_loop(self):
+        """Drain queued thought frames to connected clients"""
+        while True:
+            payload = await self._out_queue.get()
+            try:
+                await self.ws.broadcast_bytes(payload, "thought")
+            except Exception as e:
+                logger.error("❌ Thought broadcast failed: %s", e)
     
     # ============== Public Methods ==============
     
+    def _on_metrics(self, metrics: dict):
+        """Wake the observation loop early when a fresh sample looks anomalous"""
+        if self.tools.check_anomalies(metrics):
+            self._wake.set()
+    
+    async def _wait_for_next_tick(self, started_at: float):
+        """Sleep until the poll interval elapses or the loop is woken early"""
+        loop = asyncio.get_running_loop()
+        elapsed = loop.time() - started_at
+        if elapsed < self.min_interval:
+            await asyncio.sleep(self.min_interval - elapsed)
+        
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+    
     async def run_observation_loop(self):
         """Run the continuous observation loop"""
         self.is_running = True
-        print("🤖 Agent observation loop started!")
+        logger.info("🤖 Agent observation loop started!")
         
-        while self.is_running:
-            try:
-                print(f"🔄 Agent loop iteration starting...")
-                
-                initial_state = AgentState(
-                    metrics={},
-                    anomalies=[],
-                    bank_health=[],
-                    error_logs=[],
-                    thoughts=[],
-                    hypothesis="",
-                    risk_score=0.0,
-                    intervention=None,
-                    requires_approval=False,
-                    outcome=None,
-                    should_remember=False,
-                    iteration=0,
-                    should_continue=True
-                )
-                
-                # Run one iteration of the graph
-                step_count = 0
-                async for step in self.graph.astream(initial_state):
-                    step_count += 1
-                    # Log what step we're on
-                    step_name = list(step.keys())[0] if step else "unknown"
-                    print(f"  → Step {step_count}: {step_name}")
-                
-                print(f"✅ Agent loop iteration complete ({step_count} steps)")
-                
-                # Wait before next iteration
-                await asyncio.sleep(5)
-                
-            except Exception as e:
-                import traceback
-                print(f"❌ Agent loop error: {e}")
-                traceback.print_exc()
-                await asyncio.sleep(10)
+        loop = asyncio.get_running_loop()
+        error_delay = self.poll_interval
+        broadcaster_task = asyncio.create_task(self._broadcaster_loop())
+        
+        try:
+            while self.is_running:
+                started_at = loop.time()
+                try:
+                    logger.debug("🔄 Agent loop iteration starting...")
+                    
+                    initial_state: AgentState = dict(self._INITIAL_STATE_TEMPLATE)
+                    initial_state["metrics"] = {}
+                    initial_state["anomalies"] = []
+                    initial_state["anomaly_severities"] = []
+                    initial_state["bank_health"] = []
+                    initial_state["error_logs"] = []
+                    initial_state["thoughts"] = []
+                    
+                    # Run one iteration of the graph
+                    step_count = 0
+                    async for step in self.graph.astream(initial_state):
+                        step_count += 1
+                        # Log what step we're on
+                        step_name = list(step.keys())[0] if step else "unknown"
+                        logger.debug("  → Step %d: %s", step_count, step_name)
+                    
+                    logger.debug("✅ Agent loop iteration complete (%d steps)", step_count)
+                    error_delay = self.poll_interval
+                    
+                    # Wait for the next tick (or an early wake-up)
+                    await self._wait_for_next_tick(started_at)
+                    
+                except Exception as e:
+                    logger.exception("❌ Agent loop error: %s", e)
+                    # Capped exponential backoff on repeated failures
+                    error_delay = min(error_delay * 2, self.max_backoff)
+                    await asyncio.sleep(error_delay)
+        
+        finally:
+            broadcaster_task.cancel()
     
     async def get_current_metrics(self) -> SystemMetrics:
         """Get current system metrics"""
@@ -791,7 +869,8 @@ Respond in JSON format:
     
     async def get_recent_interventions(self) -> List[Intervention]:
         """Get recent interventions"""
-        return self.intervention_history[-20:]
+        history = self.intervention_history
+        return list(islice(history, max(0, len(history) - 20), None))
     
     async def approve_intervention(self, intervention_id: str) -> bool:
         """Approve a pending intervention"""
@@ -3,8 +3,65 @@ Guardrails - Safety constraints for agent actions
 Implements risk assessment and approval requirements
 """
 
-from typing import Optional
-from datetime import datetime
+from typing import Optional, Deque, Callable, Dict, Tuple
+from collections import deque, namedtuple
+import sys
+import time
+
+
+# Action names, interned so dict lookups and comparisons hit the identity fast path
+SWITCH_GATEWAY = sys.intern("switch_gateway")
+SUPPRESS_PAYMENT_METHOD = sys.intern("suppress_payment_method")
+EMERGENCY_SHUTDOWN = sys.intern("emergency_shutdown")
+ADJUST_RETRY_CONFIG = sys.intern("adjust_retry_config")
+INCREASE_MONITORING = sys.intern("increase_monitoring")
+SEND_ALERT = sys.intern("send_alert")
+
+
+# Per-action policy: whether it can skip approval, whether it always needs
+# approval, and its contribution to the intervention risk score
+ActionPolicy = namedtuple("ActionPolicy", "auto_approve needs_approval base_risk")
+
+_DEFAULT_POLICY = ActionPolicy(auto_approve=False, needs_approval=False, base_risk=0.2)
+
+ValidationResult = Tuple[bool, Optional[str]]
+
+
+# ============== Action Validators ==============
+
+def _validate_switch_gateway(params: dict) -> ValidationResult:
+    from_bank = params.get("from")
+    to_bank = params.get("to")
+    percentage = params.get("percentage", 100)
+    
+    if not from_bank or not to_bank:
+        return False, "Switch gateway requires 'from' and 'to' banks"
+    
+    if from_bank == to_bank:
+        return False, "Cannot switch traffic to the same bank"
+    
+    if percentage < 0 or percentage > 100:
+        return False, "Percentage must be between 0 and 100"
+    
+    return True, None
+
+
+def _validate_retry(params: dict) -> ValidationResult:
+    max_retries = params.get("max_retries", 2)
+    
+    if max_retries < 0 or max_retries > 10:
+        return False, "Max retries must be between 0 and 10"
+    
+    return True, None
+
+
+def _validate_suppress(params: dict) -> ValidationResult:
+    duration = params.get("duration_minutes", 30)
+    
+    if duration > 120:
+        return False, "Suppression duration cannot exceed 120 minutes"
+    
+    return True, None
 
 
 class Guardrails:
@@ -20,22 +77,27 @@ class Guardrails:
         # Risk thresholds for auto-approval
         self.auto_approve_risk_threshold = 0.4
         
-        # Actions that always require approval
-        self.approval_required_actions = {
-            "switch_gateway",  # High impact on routing
-            "suppress_payment_method",  # Affects payment options
-            "emergency_shutdown"  # Critical action
+        # Action policies; unknown actions fall back to _DEFAULT_POLICY
+        self._action_table = {
+            # Always require approval
+            SWITCH_GATEWAY: ActionPolicy(False, True, 0.4),  # High impact on routing
+            SUPPRESS_PAYMENT_METHOD: ActionPolicy(False, True, 0.3),  # Affects payment options
+            EMERGENCY_SHUTDOWN: ActionPolicy(False, True, 0.2),  # Critical action
+            # Can be auto-approved
+            ADJUST_RETRY_CONFIG: ActionPolicy(True, False, 0.1),
+            INCREASE_MONITORING: ActionPolicy(True, False, 0.0),
+            SEND_ALERT: ActionPolicy(True, False, 0.0),
         }
         
-        # Actions that can be auto-approved
-        self.auto_approve_actions = {
-            "adjust_retry_config",
-            "increase_monitoring",
-            "send_alert"
+        # Per-action validators; actions without one are always valid
+        self._validators: Dict[str, Callable[[dict], ValidationResult]] = {
+            SWITCH_GATEWAY: _validate_switch_gateway,
+            ADJUST_RETRY_CONFIG: _validate_retry,
+            SUPPRESS_PAYMENT_METHOD: _validate_suppress,
         }
         
-        # Recent actions tracking for rate limiting
-        self.recent_actions = []
+        # Recent actions tracking for rate limiting (monotonic timestamps)
+        self.recent_actions: Deque[float] = deque()
         self.max_actions_per_minute = 5
     
     def requires_approval(self, intervention: dict, state: dict) -> bool:
@@ -55,15 +117,15 @@ class Guardrails:
         Returns:
             True if human approval is required
         """
-        action = intervention.get("action", "")
+        policy = self._action_table.get(intervention.get("action", ""), _DEFAULT_POLICY)
         risk_score = state.get("risk_score", 0.5)
         
         # Check if action is in auto-approve list
-        if action in self.auto_approve_actions:
+        if policy.auto_approve:
             return False
         
         # Check if action always requires approval
-        if action in self.approval_required_actions:
+        if policy.needs_approval:
             # But auto-approve if explicitly marked and low risk
             if intervention.get("auto_approve") and risk_score < self.auto_approve_risk_threshold:
                 return False
@@ -79,7 +141,7 @@ class Guardrails:
         
         return False
     
-    def validate_action(self, intervention: dict) -> tuple[bool, Optional[str]]:
+    def validate_action(self, intervention: dict) -> ValidationResult:
         """
         Validate that an action is safe to execute.
         
@@ -89,39 +151,10 @@ class Guardrails:
         Returns:
             Tuple of (is_valid, error_message)
         """
-        action = intervention.get("action", "")
-        params = intervention.get("params", {})
-        
-        # Validate switch_gateway
-        if action == "switch_gateway":
-            from_bank = params.get("from")
-            to_bank = params.get("to")
-            percentage = params.get("percentage", 100)
-            
-            if not from_bank or not to_bank:
-                return False, "Switch gateway requires 'from' and 'to' banks"
-            
-            if from_bank == to_bank:
-                return False, "Cannot switch traffic to the same bank"
-            
-            if percentage < 0 or percentage > 100:
-                return False, "Percentage must be between 0 and 100"
-        
-        # Validate retry config
-        if action == "adjust_retry_config":
-            max_retries = params.get("max_retries", 2)
-            
-            if max_retries < 0 or max_retries > 10:
-                return False, "Max retries must be between 0 and 10"
-        
-        # Validate suppression
-        if action == "suppress_payment_method":
-            duration = params.get("duration_minutes", 30)
-            
-            if duration > 120:
-                return False, "Suppression duration cannot exceed 120 minutes"
-        
-        return True, None
+        validator = self._validators.get(intervention.get("action", ""))
+        if validator is None:
+            return True, None
+        return validator(intervention.get("params", {}))
     
     def calculate_risk_score(
         self, 
@@ -141,27 +174,21 @@ class Guardrails:
             Risk score between 0 and 1
         """
         base_risk = 0.3
-        action = intervention.get("action", "")
         
         # Action-based risk
-        action_risks = {
-            "switch_gateway": 0.4,
-            "suppress_payment_method": 0.3,
-            "adjust_retry_config": 0.1,
-            "send_alert": 0.0,
-            "increase_monitoring": 0.0
-        }
-        base_risk += action_risks.get(action, 0.2)
+        policy = self._action_table.get(intervention.get("action", ""), _DEFAULT_POLICY)
+        base_risk += policy.base_risk
         
         # State-based risk
         anomalies = state.get("anomalies", [])
         if len(anomalies) > 3:
             base_risk += 0.2  # Many anomalies = higher risk
         
-        # Severity-based adjustment
-        for anomaly in anomalies:
-            if anomaly.get("severity") == "high":
-                base_risk += 0.1
+        # Severity-based adjustment (observe stores severities alongside anomalies)
+        severities = state.get("anomaly_severities")
+        if severities is None:
+            severities = [a.get("severity") for a in anomalies if isinstance(a, dict)]
+        base_risk += 0.1 * severities.count("high")
         
         # Cap at 1.0
         return min(base_risk, 1.0)
@@ -180,11 +207,11 @@ class Guardrails:
         action = intervention.get("action", "")
         params = intervention.get("params", {})
         
-        if action == "switch_gateway":
+        if action == SWITCH_GATEWAY:
             # Reverse the gateway switch
             return {
                 "type": "rollback",
-                "action": "switch_gateway",
+                "action": SWITCH_GATEWAY,
                 "description": f"Rollback: Route traffic back to {params.get('from')}",
                 "params": {
                     "from": params.get("to"),
@@ -193,11 +220,11 @@ class Guardrails:
                 }
             }
         
-        if action == "adjust_retry_config":
+        if action == ADJUST_RETRY_CONFIG:
             # Reset to defaults
             return {
                 "type": "rollback",
-                "action": "adjust_retry_config",
+                "action": ADJUST_RETRY_CONFIG,
                 "description": "Rollback: Reset retry config to defaults",
                 "params": {
                     "max_retries": 2,
@@ -209,16 +236,14 @@ class Guardrails:
     
     def _is_rate_limited(self) -> bool:
         """Check if we've exceeded action rate limits"""
-        now = datetime.now()
+        now = time.monotonic()
         
-        # Remove actions older than 1 minute
-        self.recent_actions = [
-            action for action in self.recent_actions
-            if (now - action).seconds < 60
-        ]
+        # Remove actions older than 1 minute (oldest are on the left)
+        while self.recent_actions and now - self.recent_actions[0] >= 60:
+            self.recent_actions.popleft()
         
         return len(self.recent_actions) >= self.max_actions_per_minute
     
     def record_action(self):
         """Record an action for rate limiting"""
-        self.recent_actions.append(datetime.now())
+        self.recent_actions.append(time.monotonic())
@@ -3,15 +3,107 @@ Agent Tools - Payment Operations Actions
 These are the tools available to the LangGraph agent for payment interventions
 """
 
-from typing import List, Optional
+from typing import List, Optional, Dict, Tuple
 import asyncio
 import json
 from datetime import datetime
 import os
-import random
+import operator
+import numpy as np
+import httpx
+import structlog
 
 from app.models.schemas import BankHealth, SystemMetrics
 
+logger = structlog.get_logger()
+
+
+# Anomaly rules (VERY sensitive for demo):
+# (type, metric key, default, comparison, threshold, high-severity threshold, message)
+_ANOMALY_RULES = (
+    ("success_rate_drop", "success_rate", 100, operator.lt, 99, 95, "Success rate dropped to {:.1f}%"),
+    ("latency_spike", "avg_latency", 0, operator.gt, 220, 400, "Average latency spiked to {:.0f}ms"),
+    ("error_rate_spike", "error_rate", 0, operator.gt, 1, 5, "Error rate increased to {:.1f}%"),
+)
+
+# Column order expected by detect_anomalies_batch
+ANOMALY_METRIC_KEYS = tuple(rule[1] for rule in _ANOMALY_RULES)
+
+# Simulated error codes for _generate_simulated_errors
+_SIMULATED_ERROR_CODES = (
+    ("504", "Gateway Timeout"),
+    ("502", "Bad Gateway"),
+    ("500", "Internal Server Error"),
+    ("400", "Bad Request"),
+    ("403", "Forbidden"),
+    ("429", "Too Many Requests")
+)
+
+# RNG for simulated data (one vectorized draw per helper call)
+_rng = np.random.default_rng()
+
+# Shared Slack client, created on first alert so connections are reused
+_SLACK_CLIENT: Optional[httpx.AsyncClient] = None
+SLACK_POST_TIMEOUT = 5.0
+
+
+def _get_slack_client() -> httpx.AsyncClient:
+    """Return the pooled Slack client, creating it on first use"""
+    global _SLACK_CLIENT
+    if _SLACK_CLIENT is None or _SLACK_CLIENT.is_closed:
+        _SLACK_CLIENT = httpx.AsyncClient(
+            timeout=SLACK_POST_TIMEOUT,
+            limits=httpx.Limits(max_keepalive_connections=4)
+        )
+    return _SLACK_CLIENT
+
+
+async def close_http_client():
+    """Close the pooled Slack client (called on app shutdown)"""
+    global _SLACK_CLIENT
+    if _SLACK_CLIENT is not None:
+        await _SLACK_CLIENT.aclose()
+        _SLACK_CLIENT = None
+
+
+class BankTable:
+    """
+    Struct-of-arrays routing table: per-bank fields are parallel sequences
+    indexed through a dense bank-code -> int map.
+    """
+    
+    __slots__ = ("codes", "index", "display_names", "weights", "statuses")
+    
+    def __init__(self, banks: Dict[str, dict]):
+        self.codes = tuple(banks)
+        self.index = {code: i for i, code in enumerate(self.codes)}
+        self.display_names = tuple(bank["name"] for bank in banks.values())
+        self.weights = np.array([bank["weight"] for bank in banks.values()], dtype=np.int64)
+        self.statuses = [bank["status"] for bank in banks.values()]
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+    
+    def transfer_weight(self, from_bank: str, to_bank: str, percentage: int) -> int:
+        """Move a percentage of from_bank's weight to to_bank; returns the amount moved"""
+        i, j = self.index[from_bank], self.index[to_bank]
+        transfer = int(self.weights[i] * (percentage / 100))
+        self.weights[i] -= transfer
+        self.weights[j] += transfer
+        return transfer
+    
+    def to_dict(self) -> Dict[str, dict]:
+        """Nested-dict form used for persistence"""
+        return {
+            code: {"name": name, "weight": weight, "status": status}
+            for code, name, weight, status in zip(
+                self.codes, self.display_names, self.weights.tolist(), self.statuses
+            )
+        }
+
 
 class PaymentOpsTools:
     """
@@ -25,12 +117,12 @@ class PaymentOpsTools:
         self.ml = ml_service
         
         # Simulated bank configuration
-        self.banks = {
+        self.banks = BankTable({
             "HDFC": {"name": "HDFC Bank", "weight": 40, "status": "healthy"},
             "ICICI": {"name": "ICICI Bank", "weight": 30, "status": "healthy"},
             "SBI": {"name": "SBI Bank", "weight": 20, "status": "healthy"},
             "AXIS": {"name": "Axis Bank", "weight": 10, "status": "healthy"}
-        }
+        })
         
         # Retry configuration
         self.retry_config = {
@@ -45,24 +137,55 @@ class PaymentOpsTools:
             "latency_spike": 300,  # 300ms above baseline
             "error_rate_spike": 3.0  # 3% error rate
         }
+        
+        # Timestamp shared by everything generated within one observation tick
+        self._tick_ts: Optional[str] = None
+    
+    def begin_tick(self):
+        """Start an observation tick; simulated data reuses one timestamp until end_tick"""
+        self._tick_ts = datetime.now().isoformat()
+    
+    def end_tick(self):
+        """End the current observation tick"""
+        self._tick_ts = None
+    
+    def _now_iso(self) -> str:
+        """Current tick timestamp, or a fresh one outside of a tick"""
+        return self._tick_ts or datetime.now().isoformat()
     
     # ============== OBSERVE TOOLS ==============
     
+    def get_current_metrics_sync(self) -> Optional[dict]:
+        """
+        Fast path for get_current_metrics when the data is in-process.
+        Returns None when metrics have to be read from Redis.
+        """
+        if self.redis and self.redis.is_connected:
+            return None
+        return self._local_metrics()
+    
     async def get_current_metrics(self) -> dict:
         """
         Tool: get_current_metrics
         Description: Fetch current system performance metrics
         Returns: Dict with success_rate, avg_latency, transaction_volume, error_rate
         """
+        metrics = self.get_current_metrics_sync()
+        if metrics is not None:
+            return metrics
+        
         try:
             # Try to get from Redis
-            if self.redis and self.redis.is_connected:
-                metrics = await self.redis.get_latest_metrics()
-                if metrics:
-                    return metrics
+            metrics = await self.redis.get_latest_metrics()
+            if metrics:
+                return metrics
         except Exception:
             pass
         
+        return self._local_metrics()
+    
+    def _local_metrics(self) -> dict:
+        """Metrics from the in-process simulator, or simulated values"""
         # Fallback to direct simulator state if available
         if self.simulator and self.simulator.is_running:
             return self.simulator._calculate_metrics()
@@ -70,44 +193,53 @@ class PaymentOpsTools:
         # Return simulated metrics if Redis not available
         return self._generate_simulated_metrics()
     
+    def get_bank_status_sync(self) -> Optional[List[dict]]:
+        """
+        Fast path for get_bank_status when the data is in-process.
+        Returns None when bank health has to be read from Redis.
+        """
+        if self.redis and self.redis.is_connected:
+            return None
+        return self._enrich_with_predictions(self._local_bank_health())
+    
     async def get_bank_status(self) -> List[dict]:
         """
         Tool: get_bank_status
         Description: Get health status of all banks/issuers
         Returns: List of bank health objects
         """
+        banks = self.get_bank_status_sync()
+        if banks is not None:
+            return banks
+        
         try:
-            if self.redis and self.redis.is_connected:
-                bank_data = await self.redis.get_bank_health()
-                if bank_data:
-                    banks = bank_data
-                else:
-                    banks = None
-            else:
-                banks = None
+            banks = await self.redis.get_bank_health()
         except Exception:
             banks = None
         
         # Fallback to direct simulator state if available or generate simulated
         if not banks:
-            if self.simulator and self.simulator.is_running:
-                 banks = self.simulator._calculate_bank_health()
-            else:
-                # Return simulated bank status
-                banks = self._generate_simulated_bank_health()
+            banks = self._local_bank_health()
             
-        # Enrich with ML predictions
+        return self._enrich_with_predictions(banks)
+    
+    def _local_bank_health(self) -> List[dict]:
+        """Bank health from the in-process simulator, or simulated values"""
+        if self.simulator and self.simulator.is_running:
+            return self.simulator._calculate_bank_health()
+        
+        # Return simulated bank status
+        return self._generate_simulated_bank_health()
+    
+    def _enrich_with_predictions(self, banks: List[dict]) -> List[dict]:
+        """Attach ML failure predictions to each bank"""
         if self.ml and banks:
-            # Create dict of current stats for ML context
-            stats_dict = {b.get("name"): b for b in banks}
+            # Predictions come back aligned with the banks list
+            predictions = self.ml.get_bank_risk_list(banks)
             
-            predictions = self.ml.get_bank_risk_scores(stats_dict)
-            
-            for bank in banks:
-                # Get prediction for this bank
-                pred = predictions.get(bank.get("name"), {})
-                bank["predicted_failure_probability"] = pred.get("risk", 0.0)
-                bank["ml_reason"] = pred.get("reason", "")
+            for bank, (risk, reason) in zip(banks, predictions):
+                bank["predicted_failure_probability"] = risk
+                bank["ml_reason"] = reason
                 
         return banks
     
@@ -134,41 +266,70 @@ class PaymentOpsTools:
         Description: Run anomaly detection on current metrics using Isolation Forest
         Returns: List of detected anomalies
         """
+        return self.check_anomalies(metrics)
+    
+    def check_anomalies(self, metrics: dict) -> List[dict]:
+        """Synchronous threshold checks behind detect_anomalies"""
         anomalies = []
         
-        # Check success rate (VERY sensitive for demo)
-        success_rate = metrics.get("success_rate", 100)
-        if success_rate < 99:
-            anomalies.append({
-                "type": "success_rate_drop",
-                "severity": "high" if success_rate < 95 else "medium",
-                "value": success_rate,
-                "threshold": 99,
-                "message": f"Success rate dropped to {success_rate:.1f}%"
-            })
+        for anomaly_type, key, default, compare, threshold, high, message in _ANOMALY_RULES:
+            value = metrics.get(key, default)
+            if compare(value, threshold):
+                anomalies.append({
+                    "type": anomaly_type,
+                    "severity": "high" if compare(value, high) else "medium",
+                    "value": value,
+                    "threshold": threshold,
+                    "message": message.format(value)
+                })
         
-        # Check latency (VERY sensitive for demo)
-        avg_latency = metrics.get("avg_latency", 0)
-        if avg_latency > 220:
-            anomalies.append({
-                "type": "latency_spike",
-                "severity": "high" if avg_latency > 400 else "medium",
-                "value": avg_latency,
-                "threshold": 220,
-                "message": f"Average latency spiked to {avg_latency:.0f}ms"
-            })
+        return anomalies
+    
+    async def observe_and_detect(self) -> Tuple[dict, List[dict]]:
+        """
+        Tool: observe_and_detect
+        Description: Fetch current metrics and run the anomaly rules in one call
+        Returns: (metrics, anomalies)
+        """
+        metrics = self.get_current_metrics_sync()
+        if metrics is None:
+            metrics = await self.get_current_metrics()
+        return metrics, self.check_anomalies(metrics)
+    
+    async def detect_anomalies_batch(self, samples: np.ndarray) -> List[dict]:
+        """
+        Tool: detect_anomalies_batch
+        Description: Vectorized detect_anomalies over a window of metric snapshots
         
-        # Check error rate (VERY sensitive for demo)
-        error_rate = metrics.get("error_rate", 0)
-        if error_rate > 1:
-            anomalies.append({
-                "type": "error_rate_spike",
-                "severity": "high" if error_rate > 5 else "medium",
-                "value": error_rate,
-                "threshold": 1,
-                "message": f"Error rate increased to {error_rate:.1f}%"
-            })
+        Args:
+            samples: Array of shape (N, 3), columns ordered as ANOMALY_METRIC_KEYS
+                     (success_rate, avg_latency, error_rate)
+        
+        Returns: List of detected anomalies, each tagged with its row "index"
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, len(_ANOMALY_RULES))
+        anomalies = []
+        
+        for column, (anomaly_type, _, _, compare, threshold, high, message) in enumerate(_ANOMALY_RULES):
+            values = samples[:, column]
+            rows = np.flatnonzero(compare(values, threshold))
+            if not rows.size:
+                continue
+            
+            tripped = values[rows]
+            is_high = compare(tripped, high)
+            for row, value, high_severity in zip(rows.tolist(), tripped.tolist(), is_high.tolist()):
+                anomalies.append({
+                    "index": row,
+                    "type": anomaly_type,
+                    "severity": "high" if high_severity else "medium",
+                    "value": value,
+                    "threshold": threshold,
+                    "message": message.format(value)
+                })
         
+        # Group by sample, keeping rule order within each sample
+        anomalies.sort(key=lambda a: a["index"])
         return anomalies
     
     # ============== ACT TOOLS ==============
@@ -194,23 +355,19 @@ class PaymentOpsTools:
         try:
             # Update bank weights
             if from_bank in self.banks and to_bank in self.banks:
-                from_weight = self.banks[from_bank]["weight"]
-                transfer = int(from_weight * (percentage / 100))
-                
-                self.banks[from_bank]["weight"] -= transfer
-                self.banks[to_bank]["weight"] += transfer
+                self.banks.transfer_weight(from_bank, to_bank, percentage)
                 
                 # Persist to Redis if available
                 if self.redis and self.redis.is_connected:
-                    await self.redis.set_bank_config(self.banks)
+                    await self.redis.set_bank_config(self.banks.to_dict())
                 
-                print(f"✅ Switched {percentage}% traffic from {from_bank} to {to_bank}")
+                logger.info("✅ Switched %d%% traffic from %s to %s", percentage, from_bank, to_bank)
                 return True
             
             return False
             
         except Exception as e:
-            print(f"❌ Gateway switch failed: {e}")
+            logger.error("❌ Gateway switch failed: %s", e)
             return False
     
     async def adjust_retry_config(
@@ -243,11 +400,11 @@ class PaymentOpsTools:
             if self.redis and self.redis.is_connected:
                 await self.redis.set_retry_config(self.retry_config)
             
-            print(f"✅ Retry config updated: {self.retry_config}")
+            logger.info("✅ Retry config updated: %s", self.retry_config)
             return True
             
         except Exception as e:
-            print(f"❌ Retry config update failed: {e}")
+            logger.error("❌ Retry config update failed: %s", e)
             return False
     
     async def send_alert(
@@ -280,27 +437,31 @@ class PaymentOpsTools:
             if self.redis and self.redis.is_connected:
                 await self.redis.add_alert(alert)
             
-            print(f"🔔 Alert [{severity}]: {message}")
+            logger.info("🔔 Alert [%s]: %s", severity, message)
             
             # REAL ALERTING: Send to Slack/Opsgenie if configured
             slack_url = os.getenv("SLACK_WEBHOOK_URL")
             if slack_url:
                 try:
-                    import httpx
-                    async with httpx.AsyncClient() as client:
-                        payload = {
-                            "text": f"*{severity.upper()}*: {message}",
-                            "channel": "#payment-ops" if channel == "all" else channel
-                        }
-                        await client.post(slack_url, json=payload)
-                        print(f"  ✅ Sent to Slack")
+                    payload = {
+                        "text": f"*{severity.upper()}*: {message}",
+                        "channel": "#payment-ops" if channel == "all" else channel
+                    }
+                    # Bound the whole post so a slow Slack can't stall the agent graph
+                    await asyncio.wait_for(
+                        _get_slack_client().post(slack_url, json=payload),
+                        timeout=SLACK_POST_TIMEOUT
+                    )
+                    logger.info("  ✅ Sent to Slack")
+                except asyncio.TimeoutError:
+                    logger.warning("  ⚠️ Slack post timed out after %ss", SLACK_POST_TIMEOUT)
                 except Exception as e:
-                    print(f"  ⚠️ Failed to send to Slack: {e}")
+                    logger.warning("  ⚠️ Failed to send to Slack: %s", e)
             
             return True
             
         except Exception as e:
-            print(f"❌ Alert failed: {e}")
+            logger.error("❌ Alert failed: %s", e)
             return False
     
     async def suppress_payment_method(
@@ -329,11 +490,11 @@ class PaymentOpsTools:
             if self.redis and self.redis.is_connected:
                 await self.redis.add_suppression(suppression)
             
-            print(f"⛔ Suppressed {method} for {duration_minutes} minutes")
+            logger.info("⛔ Suppressed %s for %s minutes", method, duration_minutes)
             return True
             
         except Exception as e:
-            print(f"❌ Suppression failed: {e}")
+            logger.error("❌ Suppression failed: %s", e)
             return False
     
     # ============== LEARN TOOLS ==============
@@ -356,11 +517,11 @@ class PaymentOpsTools:
             if self.redis and self.redis.is_connected:
                 await self.redis.store_memory(memory)
             
-            print(f"💾 Stored memory: {memory.get('intervention', {}).get('type', 'unknown')}")
+            logger.info("💾 Stored memory: %s", memory.get('intervention', {}).get('type', 'unknown'))
             return True
             
         except Exception as e:
-            print(f"❌ Memory storage failed: {e}")
+            logger.error("❌ Memory storage failed: %s", e)
             return False
     
     async def recall_similar_patterns(self, pattern: dict, limit: int = 5) -> List[dict]:
@@ -387,7 +548,7 @@ class PaymentOpsTools:
             return []
             
         except Exception as e:
-            print(f"❌ Memory recall failed: {e}")
+            logger.error("❌ Memory recall failed: %s", e)
             return []
     
     # ============== SIMULATION HELPERS ==============
@@ -395,13 +556,16 @@ class PaymentOpsTools:
     def _generate_simulated_metrics(self) -> dict:
         """Generate realistic simulated metrics"""
         base_success = 97.5
+        success_noise, latency_noise, error_noise = _rng.uniform(
+            (-3, -50, -3), (1, 100, 1)
+        ).tolist()
         
         return {
-            "success_rate": base_success + random.uniform(-3, 1),
-            "avg_latency": 200 + random.uniform(-50, 100),
-            "transaction_volume": random.randint(8000, 12000),
-            "error_rate": 100 - (base_success + random.uniform(-3, 1)),
-            "timestamp": datetime.now().isoformat()
+            "success_rate": base_success + success_noise,
+            "avg_latency": 200 + latency_noise,
+            "transaction_volume": int(_rng.integers(8000, 12001)),
+            "error_rate": 100 - (base_success + error_noise),
+            "timestamp": self._now_iso()
         }
 
     async def get_failure_predictions(self) -> dict:
@@ -432,42 +596,48 @@ class PaymentOpsTools:
     
     def _generate_simulated_bank_health(self) -> List[dict]:
         """Generate simulated bank health status"""
+        now = self._now_iso()
+        n = len(self.banks)
+        success_rates = (95 + _rng.uniform(-5, 5, n)).tolist()
+        latencies = (150 + _rng.uniform(-30, 100, n)).tolist()
+        
+        banks = self.banks
         return [
             {
                 "name": code,
-                "display_name": bank["name"],
-                "status": bank["status"],
-                "success_rate": 95 + random.uniform(-5, 5),
-                "avg_latency": 150 + random.uniform(-30, 100),
-                "weight": bank["weight"],
-                "last_updated": datetime.now().isoformat()
+                "display_name": display_name,
+                "status": status,
+                "success_rate": success_rate,
+                "avg_latency": latency,
+                "weight": weight,
+                "last_updated": now
             }
-            for code, bank in self.banks.items()
+            for code, display_name, status, weight, success_rate, latency in zip(
+                banks.codes, banks.display_names, banks.statuses,
+                banks.weights.tolist(), success_rates, latencies
+            )
         ]
     
     def _generate_simulated_errors(self, limit: int) -> List[dict]:
         """Generate simulated error logs"""
-        error_codes = [
-            ("504", "Gateway Timeout"),
-            ("502", "Bad Gateway"),
-            ("500", "Internal Server Error"),
-            ("400", "Bad Request"),
-            ("403", "Forbidden"),
-            ("429", "Too Many Requests")
-        ]
+        banks = self.banks.codes
+        now = self._now_iso()
+        n = min(limit, 20)
         
-        banks = list(self.banks.keys())
+        code_idx = _rng.integers(0, len(_SIMULATED_ERROR_CODES), n).tolist()
+        bank_idx = _rng.integers(0, len(banks), n).tolist()
+        txn_ids = _rng.integers(10000, 100000, n).tolist()
         
         errors = []
-        for i in range(min(limit, 20)):
-            code, desc = random.choice(error_codes)
+        for i, (c, b, txn) in enumerate(zip(code_idx, bank_idx, txn_ids)):
+            code, desc = _SIMULATED_ERROR_CODES[c]
             errors.append({
                 "id": f"err_{i}",
                 "code": code,
                 "description": desc,
-                "bank": random.choice(banks),
-                "timestamp": datetime.now().isoformat(),
-                "transaction_id": f"txn_{random.randint(10000, 99999)}"
+                "bank": banks[b],
+                "timestamp": now,
+                "transaction_id": f"txn_{txn}"
             })
         
         return errors
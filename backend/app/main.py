@@ -8,12 +8,27 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
 import json
-from datetime import datetime
-from typing import List
+import logging
+import orjson
+import os
+from collections import deque, defaultdict
+from itertools import count
+from time import time_ns
+import numpy as np
+from typing import Any, Dict, List, Optional, Set
 import structlog
 
 from app.services.ml_service import MLService
 
+# Drop log calls below LOG_LEVEL before their message is formatted
+# (getLevelName returns a "Level X" string for unknown names: fall back to INFO)
+_log_level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+structlog.configure(
+    wrapper_class=structlog.make_filtering_bound_logger(
+        _log_level if isinstance(_log_level, int) else logging.INFO
+    )
+)
+
 logger = structlog.get_logger()
 
 from app.services.webhook_service import WebhookService
@@ -21,7 +36,10 @@ from pydantic import BaseModel
 from app.services.redis_service import RedisService
 from app.services.simulator_service import SimulatorService
 from app.agent.graph import PaymentOpsAgent
-from app.models.schemas import SystemMetrics, BankHealth, Intervention
+from app.agent.tools import close_http_client
+from app.models.schemas import (
+    SystemMetrics, BankHealth, Intervention, HealthResponse, InterventionResponse
+)
 # ... (Imports)
 
 # Models for Public API
@@ -44,36 +62,212 @@ redis_service: RedisService = None
 ml_service: MLService = None
 webhook_service: WebhookService = None
 
+# Suffix for payment/refund IDs so requests in the same millisecond don't collide
+_id_seq = count()
+
+# Simulated bank outcomes: uniform draws pre-generated in bulk
+_rng = np.random.default_rng()
+_roll_pool = deque()
+
+def _roll() -> float:
+    """Next uniform [0, 1) draw from the pre-drawn pool"""
+    if not _roll_pool:
+        _roll_pool.extend(_rng.random(4096).tolist())
+    return _roll_pool.popleft()
+
+# Simulated bank callback delay. Payments wait in one FIFO (the delay is
+# constant, so it is already in due order) drained by a single task,
+# rather than each payment sleeping in its own task.
+BANK_DELAY_SECONDS = 2.0
+_bank_callbacks: asyncio.Queue = asyncio.Queue()
+
+# Running payment callbacks: referenced so they aren't garbage collected
+# mid-flight, and capped so a burst backs up in the queue, not the loop
+MAX_INFLIGHT_PAYMENTS = 500
+_bg_tasks: Set[asyncio.Task] = set()
+_payment_slots = asyncio.Semaphore(MAX_INFLIGHT_PAYMENTS)
+
+async def _guarded(callback):
+    """Run a payment callback, releasing its slot when done"""
+    try:
+        await callback()
+    except Exception as e:
+        logger.error(f"Payment callback error: {e}")
+    finally:
+        _payment_slots.release()
+
+async def bank_callback_loop():
+    """Run queued payment callbacks once their bank delay has elapsed"""
+    loop = asyncio.get_running_loop()
+    while True:
+        due, callback = await _bank_callbacks.get()
+        try:
+            delay = due - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            await _payment_slots.acquire()
+            task = asyncio.create_task(_guarded(callback))
+            _bg_tasks.add(task)
+            task.add_done_callback(_bg_tasks.discard)
+        finally:
+            # Lets shutdown join() the queue once every callback has started
+            _bank_callbacks.task_done()
+
+# Per-bank failure predictions shared by in-flight payments; they move on
+# the order of seconds, so refetch at most every RISK_CACHE_TTL seconds
+RISK_CACHE_TTL = 0.5
+_risk_cache = {"t": float("-inf"), "v": {}}
+_risk_lock = asyncio.Lock()
+
+async def _risk_map() -> dict:
+    """Cached agent.tools.get_failure_predictions()"""
+    loop = asyncio.get_running_loop()
+    if loop.time() - _risk_cache["t"] > RISK_CACHE_TTL:
+        async with _risk_lock:
+            # Another payment may have refreshed it while we waited
+            if loop.time() - _risk_cache["t"] > RISK_CACHE_TTL:
+                _risk_cache["v"] = await agent.tools.get_failure_predictions()
+                _risk_cache["t"] = loop.time()
+    return _risk_cache["v"]
+
+# Broadcast payloads may carry numpy scalars from the ML layer
+BROADCAST_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
 # WebSocket Connection Manager
 class ConnectionManager:
-    """Manages WebSocket connections for real-time updates"""
+    """
+    Manages WebSocket connections for real-time updates.
+    Clients may subscribe to specific message types (topics); clients that
+    never subscribe receive everything, as before.
+    """
     
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.active_connections: Set[WebSocket] = set()
+        self.unfiltered: Set[WebSocket] = set()  # No subscription: all topics
+        self.topics: Dict[str, Set[WebSocket]] = defaultdict(set)
+        self.snapshots: Dict[str, Any] = {}  # Last full state sent per topic
+        self.has_clients = asyncio.Event()  # Set while anyone is connected
+        self.send_timeout = 2.0  # Seconds before a slow client is dropped
+        self.fan_out_batch_size = 50  # Clients per gather before yielding
     
     async def connect(self, websocket: WebSocket):
+        """Accept the socket; it gets broadcasts once register() is called"""
         await websocket.accept()
-        self.active_connections.append(websocket)
+    
+    def register(self, websocket: WebSocket):
+        self.active_connections.add(websocket)
+        self.unfiltered.add(websocket)
+        self.has_clients.set()
         logger.info(f"WebSocket connected. Active connections: {len(self.active_connections)}")
     
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self._forget(websocket)
         logger.info(f"WebSocket disconnected. Active connections: {len(self.active_connections)}")
     
-    async def broadcast(self, message: dict):
-        """Broadcast message to all connected clients"""
-        dead_connections = []
-        for connection in self.active_connections:
+    def subscribe(self, websocket: WebSocket, topics: List[str]):
+        """Limit a client to the given topics (message types)"""
+        if websocket not in self.active_connections:
+            return
+        self.unfiltered.discard(websocket)
+        for topic in topics:
+            self.topics[topic].add(websocket)
+    
+    def _forget(self, websocket: WebSocket):
+        self.active_connections.discard(websocket)
+        self.unfiltered.discard(websocket)
+        for subscribers in self.topics.values():
+            subscribers.discard(websocket)
+        if not self.active_connections:
+            self.has_clients.clear()
+    
+    def _recipients(self, topic: Optional[str]) -> Set[WebSocket]:
+        if topic is None:
+            return self.active_connections
+        subscribers = self.topics.get(topic)
+        return self.unfiltered | subscribers if subscribers else self.unfiltered
+    
+    async def _fan_out(self, send, recipients: Set[WebSocket]):
+        """Run send(connection) for every recipient concurrently, dropping failures"""
+        if not recipients:
+            return
+        
+        async def safe_send(connection: WebSocket):
             try:
-                await connection.send_json(message)
+                await asyncio.wait_for(send(connection), timeout=self.send_timeout)
             except Exception as e:
-                logger.error(f"Error broadcasting to connection: {e}")
-                dead_connections.append(connection)
+                logger.error(f"Error broadcasting to connection: {e!r}")
+                return connection
+            return None
+        
+        # Send in batches, yielding between them so large audiences
+        # don't starve the agent loop
+        connections = list(recipients)
+        batch_size = self.fan_out_batch_size
+        dead_connections = []
+        for start in range(0, len(connections), batch_size):
+            results = await asyncio.gather(
+                *(safe_send(conn) for conn in connections[start:start + batch_size])
+            )
+            dead_connections.extend(conn for conn in results if conn is not None)
+            if start + batch_size < len(connections):
+                await asyncio.sleep(0)
         
         # Clean up dead connections
-        for conn in dead_connections:
-            self.disconnect(conn)
+        if dead_connections:
+            for conn in dead_connections:
+                self._forget(conn)
+            logger.info(f"Dropped {len(dead_connections)} dead WebSocket(s). Active connections: {len(self.active_connections)}")
+    
+    async def broadcast(self, message: dict, topic: Optional[str] = None):
+        """Broadcast message to interested clients (topic defaults to its type)"""
+        # Serialize once for the whole audience rather than once per client
+        await self.broadcast_bytes(
+            orjson.dumps(message, option=BROADCAST_JSON_OPTIONS),
+            topic or message.get("type")
+        )
+    
+    async def broadcast_state(self, topic: str, data: Any):
+        """
+        Broadcast a state update as a delta against the last one sent:
+        changed keys for dicts, changed entries (matched by "name") for lists.
+        Sends "<topic>.delta" frames, a full "<topic>" frame when the shape
+        changes, and nothing when nothing changed.
+        """
+        previous = self.snapshots.get(topic)
+        self.snapshots[topic] = data
+        
+        delta = _state_delta(previous, data)
+        if delta is None:
+            await self.broadcast({"type": topic, "data": data}, topic)
+        elif delta:
+            await self.broadcast({"type": f"{topic}.delta", "data": delta}, topic)
+    
+    async def broadcast_bytes(self, payload: bytes, topic: Optional[str] = None):
+        """Broadcast an already-encoded JSON payload (sent as a text frame)"""
+        await self.broadcast_text(payload.decode(), topic)
+    
+    async def broadcast_text(self, text: str, topic: Optional[str] = None):
+        """Broadcast an already-encoded JSON string; no topic means every client"""
+        await self._fan_out(lambda conn: conn.send_text(text), self._recipients(topic))
+
+_MISSING = object()
+
+def _state_delta(previous: Any, current: Any):
+    """Changes from previous to current, or None if only a full frame will do"""
+    if isinstance(previous, dict) and isinstance(current, dict):
+        if previous.keys() - current.keys():
+            return None
+        return {k: v for k, v in current.items() if previous.get(k, _MISSING) != v}
+    
+    if isinstance(previous, list) and isinstance(current, list):
+        before = {item.get("name"): item for item in previous if isinstance(item, dict)}
+        after_names = [item.get("name") for item in current if isinstance(item, dict)]
+        if len(after_names) != len(current) or set(after_names) != before.keys():
+            return None
+        return [item for item in current if before[item.get("name")] != item]
+    
+    return None
 
 manager = ConnectionManager()
 
@@ -104,6 +298,7 @@ async def lifespan(app: FastAPI):
     asyncio.create_task(agent.run_observation_loop())
     asyncio.create_task(simulator.run_if_enabled())
     asyncio.create_task(broadcast_loop())
+    callback_task = asyncio.create_task(bank_callback_loop())
     
     logger.info("✅ All services initialized")
     
@@ -111,27 +306,42 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     logger.info("🛑 Shutting down services...")
+    # Let queued and in-flight payment callbacks deliver their webhooks first
+    await _bank_callbacks.join()
+    callback_task.cancel()
+    await asyncio.gather(callback_task, *_bg_tasks, return_exceptions=True)
     await redis_service.disconnect()
     await webhook_service.close()
+    await close_http_client()
 
 async def broadcast_loop():
-    """Background task to broadcast real-time metrics to frontend"""
+    """Background task to push real-time metrics to frontend as Redis publishes them"""
     logger.info("📡 Starting metrics broadcast loop...")
     while True:
         try:
-            if redis_service and redis_service.is_connected:
-                # Get latest data
-                metrics = await redis_service.get_latest_metrics()
-                banks = await redis_service.get_bank_health()
-                
-                # Broadcast if available
-                if metrics:
-                    await manager.broadcast({"type": "metrics", "data": metrics})
-                
-                if banks:
-                    await manager.broadcast({"type": "banks", "data": banks})
-                    
-            await asyncio.sleep(1) # Broadcast every second
+            if not (redis_service and redis_service.is_connected):
+                await asyncio.sleep(5)
+                continue
+            
+            # Nobody to push to: stay unsubscribed until a client connects
+            await manager.has_clients.wait()
+            
+            pubsub = await redis_service.subscribe_dashboard()
+            try:
+                async for msg in pubsub.listen():
+                    if not manager.active_connections:
+                        # Snapshots go stale while unsubscribed; the next
+                        # client is seeded from Redis and gets full frames
+                        manager.snapshots.clear()
+                        break
+                    if msg["type"] != "message":
+                        continue
+                    # Channel names double as message types
+                    await manager.broadcast_state(msg["channel"], orjson.loads(msg["data"]))
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             logger.error(f"Broadcast loop error: {e}")
             await asyncio.sleep(5)
@@ -161,7 +371,7 @@ async def create_payment(payment: PaymentRequest):
     Standard Payment Initiation Endpoint.
     Simulates a payment gateway (like Stripe/Razorpay).
     """
-    txn_id = f"txn_{int(datetime.now().timestamp() * 1000)}"
+    txn_id = f"txn_{time_ns() // 1_000_000}_{next(_id_seq)}"
     
     logger.info(f"💳 Payment Initiated: {txn_id} for {payment.amount} {payment.currency}")
     
@@ -175,20 +385,17 @@ async def create_payment(payment: PaymentRequest):
         "client_secret": f"sec_{txn_id}"
     }
     
-    # Trigger Async Webhook (Simulate bank callback delay)
+    # Trigger Async Webhook (runs after the simulated bank callback delay)
     async def process_async():
-        await asyncio.sleep(2) # Bank delay
-        
         # Decide success/failure based on randomness (or agent state!)
-        import random
-        success = random.random() > 0.1 # 90% success baseline
+        success = _roll() > 0.1 # 90% success baseline
         
         # If High Risk, fail more often (coupling with Agent knowledge!)
         if agent and agent.tools:
-            risk_map = await agent.tools.get_failure_predictions()
+            risk_map = await _risk_map()
             hdfc_risk = risk_map.get("HDFC", {}).get("risk", 0.0)
             if hdfc_risk > 0.6:
-                success = random.random() > 0.5 # 50/50 if high risk
+                success = _roll() > 0.5 # 50/50 if high risk
             
         final_status = "succeeded" if success else "failed"
         
@@ -204,7 +411,9 @@ async def create_payment(payment: PaymentRequest):
         if webhook_service:
             await webhook_service.dispatch_event(event_type, payload)
             
-    asyncio.create_task(process_async())
+    _bank_callbacks.put_nowait(
+        (asyncio.get_running_loop().time() + BANK_DELAY_SECONDS, process_async)
+    )
     
     return response
 
@@ -213,7 +422,7 @@ async def create_refund(refund: RefundRequest):
     """
     Standard Refund Endpoint.
     """
-    refund_id = f"re_{int(datetime.now().timestamp() * 1000)}"
+    refund_id = f"re_{time_ns() // 1_000_000}_{next(_id_seq)}"
     
     logger.info(f"💸 Refund Initiated: {refund_id} for {refund.payment_id}")
     
@@ -240,7 +449,7 @@ async def root():
         "version": "1.0.0"
     }
 
-@app.get("/api/health")
+@app.get("/api/health", response_model=HealthResponse)
 async def health_check():
     """System health check"""
     return {
@@ -280,7 +489,7 @@ async def get_pending_interventions():
         raise HTTPException(status_code=503, detail="Agent not initialized")
     return list(agent.pending_interventions.values())
 
-@app.post("/api/interventions/{intervention_id}/approve")
+@app.post("/api/interventions/{intervention_id}/approve", response_model=InterventionResponse)
 async def approve_intervention(intervention_id: str):
     """Approve a pending intervention"""
     if not agent:
@@ -290,7 +499,7 @@ async def approve_intervention(intervention_id: str):
         raise HTTPException(status_code=404, detail="Intervention not found")
     return {"status": "approved", "intervention_id": intervention_id}
 
-@app.post("/api/interventions/{intervention_id}/reject")
+@app.post("/api/interventions/{intervention_id}/reject", response_model=InterventionResponse)
 async def reject_intervention(intervention_id: str):
     """Reject a pending intervention"""
     if not agent:
@@ -362,23 +571,82 @@ async def trigger_scenario(scenario_name: str):
 
 # ============== WEBSOCKET ENDPOINT ==============
 
+# Idle time before a silent client is probed, and how long the probe may take
+WS_IDLE_TIMEOUT = 30.0
+WS_PING_TIMEOUT = 5.0
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time updates"""
     await manager.connect(websocket)
     try:
+        # Broadcasts are deltas against manager.snapshots, so seed new clients
+        # with those (falling back to Redis before the first publish) and only
+        # register for broadcasts once the seed matches the current snapshots
+        while True:
+            seen = (manager.snapshots.get("metrics"), manager.snapshots.get("banks"))
+            metrics, banks = seen
+            if (metrics is None or banks is None) and redis_service and redis_service.is_connected:
+                redis_metrics, redis_banks = await redis_service.get_dashboard_snapshot()
+                metrics = metrics if metrics is not None else redis_metrics
+                banks = banks if banks is not None else redis_banks
+            if metrics:
+                await websocket.send_json({"type": "metrics", "data": metrics})
+            if banks:
+                await websocket.send_json({"type": "banks", "data": banks})
+            # No await between this check and register(): a broadcast during
+            # the seed means re-sending the newer snapshots instead
+            if manager.snapshots.get("metrics") is seen[0] and manager.snapshots.get("banks") is seen[1]:
+                manager.register(websocket)
+                break
+        
         while True:
             # Keep connection alive and listen for client messages
-            data = await websocket.receive_text()
+            try:
+                data = await asyncio.wait_for(websocket.receive_text(), timeout=WS_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Quiet peer: probe it. The dashboard never replies, so only a
+                # failed or stalled send marks the peer as gone
+                try:
+                    await asyncio.wait_for(
+                        websocket.send_json({"type": "ping"}), timeout=WS_PING_TIMEOUT
+                    )
+                except Exception:
+                    raise WebSocketDisconnect(code=1001)
+                continue
             # Echo back or handle client commands if needed
             if data == "ping":
                 await websocket.send_json({"type": "pong"})
+            elif data.startswith("{"):
+                # e.g. {"subscribe": ["metrics", "banks"]}
+                try:
+                    command = json.loads(data)
+                except ValueError:
+                    continue
+                topics = command.get("subscribe") if isinstance(command, dict) else None
+                if isinstance(topics, list):
+                    manager.subscribe(websocket, [str(t) for t in topics])
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
+    finally:
+        # Also runs on cancellation, so the manager never keeps a stale socket
         manager.disconnect(websocket)
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # uvloop + httptools come with uvicorn[standard] (uvloop has no Windows build).
+    # Keep one worker: ConnectionManager is per-process, and agent/simulator
+    # state lives in this process too. Pass the app object itself: an import
+    # string would import this module a second time as app.main.
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        ws="websockets",
+        workers=1
+    )
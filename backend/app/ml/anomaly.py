@@ -8,9 +8,43 @@ import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 import joblib
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Deque
+from collections import deque
 from datetime import datetime
+import asyncio
+import math
+import operator
 import os
+import time
+import structlog
+
+logger = structlog.get_logger()
+
+# Optional: compiled ONNX inference for the Isolation Forest
+try:
+    import onnxruntime as ort
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Rule-based checks, in reporting order:
+# (type, feature, comparison, threshold key, threshold sign,
+#  high-severity cutoff (None = fixed severity), fixed severity, message, abs value in message)
+_RULES = (
+    ('success_rate_low', 'success_rate', operator.lt, 'success_rate_min', 1, 85, None,
+     "Success rate critically low at {:.1f}%", False),
+    ('success_rate_drop', 'success_rate_change', operator.lt, 'success_rate_drop', -1, None, 'high',
+     "Sudden success rate drop of {:.1f}%", True),
+    ('latency_high', 'avg_latency', operator.gt, 'latency_max', 1, 800, None,
+     "Latency spike to {:.0f}ms", False),
+    ('latency_spike', 'latency_change', operator.gt, 'latency_spike', 1, None, 'medium',
+     "Sudden latency increase of {:.0f}ms", False),
+    ('error_rate_high', 'error_rate', operator.gt, 'error_rate_max', 1, 15, None,
+     "Error rate elevated to {:.1f}%", False),
+)
+
 
 class AnomalyDetector:
     """
@@ -42,8 +76,29 @@ class AnomalyDetector:
         }
         
         # Historical data for trend analysis
-        self.history: List[Dict] = []
         self.history_max_size = 1000
+        self.history: Deque[Dict] = deque(maxlen=self.history_max_size)
+        
+        # Sliding windows over the most recent samples, with running sums so
+        # the derived features are O(1) per detect call
+        self.window_size = 5
+        self._lat_win: Deque[float] = deque(maxlen=self.window_size)
+        self._sr_win: Deque[float] = deque(maxlen=self.window_size)
+        self._lat_sum = 0.0
+        self._lat_sumsq = 0.0
+        self._sr_sum = 0.0
+        
+        # Batched ML scoring for detect_async
+        self.batch_size = 64
+        self.batch_interval = 0.1  # Seconds between batch scoring passes
+        self._pending: Deque[Tuple[np.ndarray, asyncio.Future]] = deque()
+        self._scorer_task: Optional[asyncio.Task] = None
+        
+        # Inference fast path: scaler inlined as arrays, ONNX session if available
+        self._scale_mean: Optional[np.ndarray] = None
+        self._scale_std: Optional[np.ndarray] = None
+        self._onnx_model: Optional[bytes] = None
+        self._onnx_session = None
         
         # Model path
         self.model_path = os.path.join(os.path.dirname(__file__), 'models', 'anomaly_detector.joblib')
@@ -60,13 +115,13 @@ class AnomalyDetector:
         """
         try:
             if len(data) < 100:
-                print("Warning: Less than 100 samples, model may not be reliable")
+                logger.warning("Less than 100 samples, model may not be reliable")
             
             # Prepare features
             X = self._prepare_features(data)
             
             # Scale features
-            X_scaled = self.scaler.fit_transform(X)
+            X_scaled = self.scaler.fit_transform(X).astype(np.float32, copy=False)
             
             # Train Isolation Forest
             self.model = IsolationForest(
@@ -77,16 +132,18 @@ class AnomalyDetector:
             )
             self.model.fit(X_scaled)
             
+            self._onnx_model = self._convert_to_onnx()
+            self._prepare_inference()
             self.is_trained = True
             
             # Save model
             self._save_model()
             
-            print(f"✅ Anomaly detector trained on {len(data)} samples")
+            logger.info("✅ Anomaly detector trained on %d samples", len(data))
             return True
             
         except Exception as e:
-            print(f"❌ Training failed: {e}")
+            logger.error("❌ Training failed: %s", e)
             return False
     
     def detect(self, metrics: Dict) -> List[Dict]:
@@ -120,43 +177,32 @@ class AnomalyDetector:
     
     def _prepare_features(self, data: pd.DataFrame) -> np.ndarray:
         """Prepare feature matrix from raw data"""
-        features = []
+        def column(name: str, default: float) -> pd.Series:
+            if name in data:
+                return data[name].astype(float)
+            return pd.Series(float(default), index=data.index)
         
-        for i in range(len(data)):
-            row = data.iloc[i]
-            
-            # Basic features
-            success_rate = row.get('success_rate', 100)
-            avg_latency = row.get('avg_latency', 200)
-            error_rate = row.get('error_rate', 0)
-            volume = row.get('transaction_volume', 10000)
-            
-            # Derived features (use previous rows if available)
-            latency_std = 0
-            success_rate_change = 0
-            latency_change = 0
-            
-            if i >= 5:
-                window = data.iloc[max(0, i-5):i]
-                latency_std = window['avg_latency'].std() if 'avg_latency' in window else 0
-                
-                prev_success = window['success_rate'].mean() if 'success_rate' in window else success_rate
-                success_rate_change = success_rate - prev_success
-                
-                prev_latency = window['avg_latency'].mean() if 'avg_latency' in window else avg_latency
-                latency_change = avg_latency - prev_latency
-            
-            features.append([
-                success_rate,
-                avg_latency,
-                error_rate,
-                volume,
-                latency_std or 0,
-                success_rate_change,
-                latency_change
-            ])
-        
-        return np.array(features)
+        # Basic features
+        success_rate = column('success_rate', 100)
+        avg_latency = column('avg_latency', 200)
+        error_rate = column('error_rate', 0)
+        volume = column('transaction_volume', 10000)
+        
+        # Derived features over the previous 5 rows (zero until 5 rows exist)
+        window = self.window_size
+        latency_std = avg_latency.rolling(window).std().shift(1).fillna(0)
+        success_rate_change = (success_rate - success_rate.rolling(window).mean().shift(1)).fillna(0)
+        latency_change = (avg_latency - avg_latency.rolling(window).mean().shift(1)).fillna(0)
+        
+        return np.column_stack([
+            success_rate.to_numpy(np.float32),
+            avg_latency.to_numpy(np.float32),
+            error_rate.to_numpy(np.float32),
+            volume.to_numpy(np.float32),
+            latency_std.to_numpy(np.float32),
+            success_rate_change.to_numpy(np.float32),
+            latency_change.to_numpy(np.float32)
+        ])
     
     def _calculate_features(self, metrics: Dict) -> Dict:
         """Calculate features for a single metric point"""
@@ -167,13 +213,14 @@ class AnomalyDetector:
             'transaction_volume': metrics.get('transaction_volume', 10000),
         }
         
-        # Calculate from history
-        if len(self.history) >= 5:
-            recent = self.history[-5:]
+        # Calculate from the sliding window
+        n = len(self._lat_win)
+        if n >= self.window_size:
+            lat_mean = self._lat_sum / n
             
-            features['latency_std'] = np.std([h['avg_latency'] for h in recent])
-            features['success_rate_change'] = features['success_rate'] - np.mean([h['success_rate'] for h in recent])
-            features['latency_change'] = features['avg_latency'] - np.mean([h['avg_latency'] for h in recent])
+            features['latency_std'] = math.sqrt(max(0.0, self._lat_sumsq / n - lat_mean ** 2))
+            features['success_rate_change'] = features['success_rate'] - self._sr_sum / n
+            features['latency_change'] = features['avg_latency'] - lat_mean
         else:
             features['latency_std'] = 0
             features['success_rate_change'] = 0
@@ -184,93 +231,63 @@ class AnomalyDetector:
     def _rule_based_detection(self, metrics: Dict, features: Dict) -> List[Dict]:
         """Simple rule-based anomaly detection"""
         anomalies = []
+        thresholds = self.thresholds
         
-        success_rate = features['success_rate']
-        avg_latency = features['avg_latency']
-        error_rate = features['error_rate']
-        
-        # Check success rate
-        if success_rate < self.thresholds['success_rate_min']:
-            severity = 'high' if success_rate < 85 else 'medium'
-            anomalies.append({
-                'type': 'success_rate_low',
-                'severity': severity,
-                'value': success_rate,
-                'threshold': self.thresholds['success_rate_min'],
-                'message': f"Success rate critically low at {success_rate:.1f}%",
-                'source': 'rule'
-            })
-        
-        # Check for sudden drops
-        if features['success_rate_change'] < -self.thresholds['success_rate_drop']:
-            anomalies.append({
-                'type': 'success_rate_drop',
-                'severity': 'high',
-                'value': features['success_rate_change'],
-                'threshold': -self.thresholds['success_rate_drop'],
-                'message': f"Sudden success rate drop of {abs(features['success_rate_change']):.1f}%",
-                'source': 'rule'
-            })
-        
-        # Check latency
-        if avg_latency > self.thresholds['latency_max']:
-            severity = 'high' if avg_latency > 800 else 'medium'
-            anomalies.append({
-                'type': 'latency_high',
-                'severity': severity,
-                'value': avg_latency,
-                'threshold': self.thresholds['latency_max'],
-                'message': f"Latency spike to {avg_latency:.0f}ms",
-                'source': 'rule'
-            })
-        
-        # Check latency spike
-        if features['latency_change'] > self.thresholds['latency_spike']:
-            anomalies.append({
-                'type': 'latency_spike',
-                'severity': 'medium',
-                'value': features['latency_change'],
-                'threshold': self.thresholds['latency_spike'],
-                'message': f"Sudden latency increase of {features['latency_change']:.0f}ms",
-                'source': 'rule'
-            })
-        
-        # Check error rate
-        if error_rate > self.thresholds['error_rate_max']:
-            severity = 'high' if error_rate > 15 else 'medium'
+        for anomaly_type, feature, compare, threshold_key, sign, high_cutoff, severity, message, use_abs in _RULES:
+            value = features[feature]
+            threshold = sign * thresholds[threshold_key]
+            if not compare(value, threshold):
+                continue
+            
+            if high_cutoff is not None:
+                severity = 'high' if compare(value, high_cutoff) else 'medium'
+            
             anomalies.append({
-                'type': 'error_rate_high',
+                'type': anomaly_type,
                 'severity': severity,
-                'value': error_rate,
-                'threshold': self.thresholds['error_rate_max'],
-                'message': f"Error rate elevated to {error_rate:.1f}%",
+                'value': value,
+                'threshold': threshold,
+                'message': message.format(abs(value) if use_abs else value),
                 'source': 'rule'
             })
         
         return anomalies
     
+    def _feature_vector(self, features: Dict) -> np.ndarray:
+        """Order a feature dict into a float32 model input row"""
+        row = np.empty(len(self.feature_columns), dtype=np.float32)
+        for i, name in enumerate(self.feature_columns):
+            row[i] = features[name]
+        return row
+    
     def _ml_detection(self, features: Dict) -> List[Dict]:
         """ML-based anomaly detection using Isolation Forest"""
-        anomalies = []
-        
+        return self._ml_detection_batch(self._feature_vector(features)[np.newaxis, :])[0]
+    
+    def _ml_detection_batch(self, X: np.ndarray) -> List[List[Dict]]:
+        """Score a (B, 7) feature matrix in one predict/score_samples call"""
         try:
-            # Prepare feature vector
-            X = np.array([[
-                features['success_rate'],
-                features['avg_latency'],
-                features['error_rate'],
-                features['transaction_volume'],
-                features['latency_std'],
-                features['success_rate_change'],
-                features['latency_change']
-            ]])
-            
-            # Scale
-            X_scaled = self.scaler.transform(X)
+            # Scale (inlined StandardScaler)
+            X_scaled = (X - self._scale_mean) / self._scale_std
             
             # Predict
-            prediction = self.model.predict(X_scaled)[0]
-            score = self.model.score_samples(X_scaled)[0]
+            if self._onnx_session is not None:
+                labels, decision = self._onnx_session.run(
+                    None, {'X': X_scaled}
+                )
+                predictions = labels.ravel()
+                # ONNX emits decision_function; shift back to score_samples
+                scores = decision.ravel() + self.model.offset_
+            else:
+                predictions = self.model.predict(X_scaled)
+                scores = self.model.score_samples(X_scaled)
+        except Exception as e:
+            logger.error("ML detection error: %s", e)
+            return [[] for _ in range(len(X))]
+        
+        results = []
+        for prediction, score in zip(predictions, scores):
+            anomalies = []
             
             # -1 means anomaly
             if prediction == -1:
@@ -280,26 +297,67 @@ class AnomalyDetector:
                 anomalies.append({
                     'type': 'ml_anomaly',
                     'severity': severity,
-                    'value': score,
+                    'value': float(score),
                     'threshold': -0.1,
                     'message': f"ML model detected unusual pattern (confidence: {abs(score):.2f})",
                     'source': 'ml'
                 })
+            
+            results.append(anomalies)
         
-        except Exception as e:
-            print(f"ML detection error: {e}")
+        return results
+    
+    # ============== Batched Detection ==============
+    
+    async def detect_async(self, metrics: Dict) -> List[Dict]:
+        """
+        Like detect(), but the Isolation Forest scoring is queued and done in
+        batches by a background scorer. Rule-based checks still run immediately.
+        """
+        self._update_history(metrics)
+        features = self._calculate_features(metrics)
+        anomalies = self._rule_based_detection(metrics, features)
         
-        return anomalies
+        if self.is_trained and self.model is not None:
+            self._ensure_batch_scorer()
+            future = asyncio.get_running_loop().create_future()
+            self._pending.append((self._feature_vector(features), future))
+            anomalies.extend(await future)
+        
+        return self._score_anomalies(anomalies)
+    
+    def _ensure_batch_scorer(self):
+        """Start the background batch scorer if it isn't running"""
+        if self._scorer_task is None or self._scorer_task.done():
+            self._scorer_task = asyncio.create_task(self._run_batch_scorer())
+    
+    async def _run_batch_scorer(self):
+        """Every batch_interval, score everything queued by detect_async"""
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            self._score_pending()
+    
+    def _score_pending(self):
+        """Drain the pending queue in chunks of at most batch_size"""
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            results = self._ml_detection_batch(np.vstack([row for row, _ in batch]))
+            
+            for (_, future), anomalies in zip(batch, results):
+                if not future.done():
+                    future.set_result(anomalies)
     
     def _score_anomalies(self, anomalies: List[Dict]) -> List[Dict]:
         """Score and deduplicate anomalies"""
         if not anomalies:
             return []
         
-        # Add timestamps and IDs
+        # Add timestamps and IDs (one clock read for the whole batch)
+        ts_ns = time.time_ns()
+        detected_at = datetime.fromtimestamp(ts_ns / 1e9).isoformat()
         for i, anomaly in enumerate(anomalies):
-            anomaly['id'] = f"anomaly_{datetime.now().timestamp()}_{i}"
-            anomaly['detected_at'] = datetime.now().isoformat()
+            anomaly['id'] = f"anomaly_{ts_ns}_{i}"
+            anomaly['detected_at'] = detected_at
         
         # Sort by severity
         severity_order = {'high': 0, 'medium': 1, 'low': 2}
@@ -308,18 +366,60 @@ class AnomalyDetector:
         return anomalies
     
     def _update_history(self, metrics: Dict):
-        """Update historical data"""
+        """Update historical data (the deque trims itself to history_max_size)"""
+        success_rate = metrics.get('success_rate', 100)
+        avg_latency = metrics.get('avg_latency', 200)
+        
         self.history.append({
-            'success_rate': metrics.get('success_rate', 100),
-            'avg_latency': metrics.get('avg_latency', 200),
+            'success_rate': success_rate,
+            'avg_latency': avg_latency,
             'error_rate': metrics.get('error_rate', 0),
             'transaction_volume': metrics.get('transaction_volume', 10000),
             'timestamp': datetime.now().isoformat()
         })
         
-        # Trim history
-        if len(self.history) > self.history_max_size:
-            self.history = self.history[-self.history_max_size:]
+        # Slide the feature windows, keeping the running sums in step
+        if len(self._lat_win) == self.window_size:
+            old_lat = self._lat_win[0]
+            self._lat_sum -= old_lat
+            self._lat_sumsq -= old_lat * old_lat
+            self._sr_sum -= self._sr_win[0]
+        
+        self._lat_win.append(avg_latency)
+        self._sr_win.append(success_rate)
+        self._lat_sum += avg_latency
+        self._lat_sumsq += avg_latency * avg_latency
+        self._sr_sum += success_rate
+    
+    def _convert_to_onnx(self) -> Optional[bytes]:
+        """Serialize the fitted Isolation Forest to ONNX (None if unavailable)"""
+        if not ONNX_AVAILABLE:
+            return None
+        try:
+            onx = convert_sklearn(
+                self.model,
+                initial_types=[('X', FloatTensorType([None, len(self.feature_columns)]))],
+                target_opset={'': 15, 'ai.onnx.ml': 3}
+            )
+            return onx.SerializeToString()
+        except Exception as e:
+            logger.warning("ONNX conversion failed, using sklearn inference: %s", e)
+            return None
+    
+    def _prepare_inference(self):
+        """Cache scaler parameters and build the ONNX session for scoring"""
+        # float32 throughout: the forest compares in float32 anyway
+        self._scale_mean = self.scaler.mean_.astype(np.float32)
+        self._scale_std = self.scaler.scale_.astype(np.float32)
+        self._onnx_session = None
+        
+        if ONNX_AVAILABLE and self._onnx_model:
+            try:
+                self._onnx_session = ort.InferenceSession(
+                    self._onnx_model, providers=['CPUExecutionProvider']
+                )
+            except Exception as e:
+                logger.warning("ONNX session failed, using sklearn inference: %s", e)
     
     def _save_model(self):
         """Save model to disk"""
@@ -327,11 +427,12 @@ class AnomalyDetector:
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
             joblib.dump({
                 'model': self.model,
-                'scaler': self.scaler
-            }, self.model_path)
-            print(f"Model saved to {self.model_path}")
+                'scaler': self.scaler,
+                'onnx': self._onnx_model
+            }, self.model_path, compress=3)
+            logger.info("Model saved to %s", self.model_path)
         except Exception as e:
-            print(f"Failed to save model: {e}")
+            logger.error("Failed to save model: %s", e)
     
     def load_model(self) -> bool:
         """Load model from disk"""
@@ -340,11 +441,13 @@ class AnomalyDetector:
                 data = joblib.load(self.model_path)
                 self.model = data['model']
                 self.scaler = data['scaler']
+                self._onnx_model = data.get('onnx')
+                self._prepare_inference()
                 self.is_trained = True
-                print(f"Model loaded from {self.model_path}")
+                logger.info("Model loaded from %s", self.model_path)
                 return True
         except Exception as e:
-            print(f"Failed to load model: {e}")
+            logger.error("Failed to load model: %s", e)
         return False
 
 
@@ -4,13 +4,103 @@ Predictive throttling and failure probability estimation
 """
 
 import numpy as np
-import pandas as pd
-from xgboost import XGBClassifier
-from sklearn.preprocessing import StandardScaler, LabelEncoder
-import joblib
-from typing import List, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
+from importlib.util import find_spec
 import os
+import threading
+import time
+
+# xgboost, sklearn, pandas and joblib are imported where they're needed so that
+# processes that only serve rule-based predictions never load them
+if TYPE_CHECKING:
+    import pandas as pd
+    from xgboost import XGBClassifier
+    from sklearn.preprocessing import StandardScaler, LabelEncoder
+
+# Optional: compile the trained booster to a native library for inference.
+# Only probed here; imported when a model is compiled or loaded
+TREELITE_AVAILABLE = find_spec("treelite") is not None and find_spec("tl2cgen") is not None
+
+# Optional: ONNX Runtime inference when no C toolchain is around for Treelite.
+# Only probed here; imported when a model is converted or loaded
+ONNX_AVAILABLE = find_spec("onnxruntime") is not None and find_spec("onnxmltools") is not None
+
+# Optional: LZ4 for the saved model bundle (faster to decompress than zlib)
+try:
+    import lz4  # noqa: F401 - joblib picks it up by name
+    MODEL_COMPRESSION = ('lz4', 3)
+except ImportError:
+    MODEL_COMPRESSION = 3
+
+# Optional: JIT-compile the scalar scoring kernels
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+
+@njit(cache=True, fastmath=True)
+def _score_rule(success_rate: float, latency: float, hour: int) -> float:
+    """Rule-based failure risk from bank health and time of day"""
+    risk = 0.0
+    
+    if success_rate < 90:
+        risk += 0.3
+    if success_rate < 80:
+        risk += 0.3
+    if latency > 400:
+        risk += 0.2
+    if latency > 600:
+        risk += 0.2
+    
+    # Time-based risk (higher during peak hours)
+    if 10 <= hour <= 14 or 18 <= hour <= 21:
+        risk += 0.1  # Peak hours
+    
+    return min(1.0, risk)
+
+
+# Model input order; feature dicts are flattened into prediction buffers in this order
+_FEATURE_ORDER = (
+    'bank_encoded',
+    'method_encoded',
+    'hour_of_day',
+    'day_of_week',
+    'recent_success_rate',
+    'recent_latency',
+    'recent_volume',
+    'bank_success_rate',
+    'bank_latency',
+    'method_success_rate'
+)
+
+# Failure probability -> risk level / recommendation (a value must exceed a bin edge to move up)
+_RISK_BINS = np.array([0.3, 0.5, 0.7])
+_RISK_LEVELS = ('low', 'medium', 'high', 'critical')
+_RISK_RECS = (
+    'Normal operation',
+    'Monitor closely, prepare backup',
+    'Consider reducing traffic to this path',
+    'Immediately reroute traffic to backup'
+)
+
+_RULE_RISK_BINS = np.array([0.3, 0.6])
+_RULE_RISK_LEVELS = ('low', 'medium', 'high')
+_RULE_RISK_RECS = (
+    'Normal operation',
+    'Monitor closely',
+    'Consider traffic rerouting'
+)
+
+
+# Compile at import so the first prediction doesn't pay for it
+_score_rule(95.0, 200.0, 12)
 
 
 class FailurePredictor:
@@ -20,38 +110,68 @@ class FailurePredictor:
     """
     
     def __init__(self):
-        self.model: Optional[XGBClassifier] = None
-        self.scaler = StandardScaler()
-        self.bank_encoder = LabelEncoder()
-        self.method_encoder = LabelEncoder()
+        self.model: Optional["XGBClassifier"] = None
+        self._booster = None  # self.model's Booster, used for inference
+        self.scaler: Optional["StandardScaler"] = None
+        self.bank_encoder: Optional["LabelEncoder"] = None
+        self.method_encoder: Optional["LabelEncoder"] = None
         self.is_trained = False
         
         # Feature columns
-        self.feature_columns = [
-            'bank_encoded',
-            'method_encoded',
-            'hour_of_day',
-            'day_of_week',
-            'recent_success_rate',
-            'recent_latency',
-            'recent_volume',
-            'bank_success_rate',
-            'bank_latency',
-            'method_success_rate'
-        ]
+        self.feature_columns = list(_FEATURE_ORDER)
         
         # Known banks and methods
         self.known_banks = ['HDFC', 'ICICI', 'SBI', 'AXIS', 'KOTAK', 'YES', 'UNKNOWN']
         self.known_methods = ['visa', 'mastercard', 'upi', 'rupay', 'amex', 'unknown']
         
-        # Prediction cache
-        self.prediction_cache: Dict[str, Dict] = {}
+        # Label -> code maps mirroring the fitted encoders, for single-value lookups
+        self._bank_idx: Dict[str, int] = {}
+        self._method_idx: Dict[str, int] = {}
+        
+        # Per-bank trend slopes [success_rate_slope, latency_slope], one row per known bank
+        # (static: slight decline in success rate and rise in latency per minute)
+        self._trend_idx = {b: i for i, b in enumerate(self.known_banks)}
+        self._trend = np.tile(np.array([-0.1, 2.0]), (len(self.known_banks), 1))
+        
+        # Prediction cache: key -> (monotonic expiry, prediction), least recently used first
+        self.prediction_cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
         self.cache_ttl_seconds = 60
+        self.cache_max_size = 1024
+        self._cache_lock = threading.Lock()  # OrderedDict reordering isn't thread-safe
+        
+        # (hour, weekday) for the time features, refreshed at most every clock_ttl_seconds
+        self.clock_ttl_seconds = 30
+        self._clock: Tuple[int, int] = (0, 0)
+        self._clock_expires = float('-inf')
         
         # Model path
         self.model_path = os.path.join(os.path.dirname(__file__), 'models', 'failure_predictor.joblib')
+        
+        # Treelite-compiled booster (XGBoost is then only used for training)
+        self.tl_libpath = os.path.join(os.path.dirname(__file__), 'models', 'failure_predictor.so')
+        self.tl_predictor = None
+        self._tl_dmatrix = None  # tl2cgen.DMatrix, bound once the predictor loads
+        
+        # ONNX export of the booster, served with ONNX Runtime when Treelite isn't available
+        self._onnx_model: Optional[bytes] = None
+        self._onnx_session = None
+        
+        # Inlined StandardScaler for single-row predictions
+        self._mean: Optional[np.ndarray] = None
+        self._inv_scale: Optional[np.ndarray] = None
+        
+        # Per-thread (1, n_features) row reused by _ml_predict
+        self._local = threading.local()
+    
+    @property
+    def _pred_buf(self) -> np.ndarray:
+        """This thread's preallocated prediction row"""
+        buf = getattr(self._local, 'buf', None)
+        if buf is None:
+            buf = self._local.buf = np.empty((1, len(_FEATURE_ORDER)), dtype=np.float32)
+        return buf
     
-    def train(self, data: pd.DataFrame) -> bool:
+    def train(self, data: "pd.DataFrame") -> bool:
         """
         Train the XGBoost failure predictor.
         
@@ -61,6 +181,9 @@ class FailurePredictor:
         Returns:
             True if training successful
         """
+        from xgboost import XGBClassifier
+        from sklearn.preprocessing import StandardScaler, LabelEncoder
+        
         try:
             if 'success' not in data.columns:
                 raise ValueError("Data must contain 'success' column")
@@ -69,14 +192,17 @@ class FailurePredictor:
                 print("Warning: Less than 500 samples, model may not be reliable")
             
             # Fit encoders
-            self.bank_encoder.fit(self.known_banks)
-            self.method_encoder.fit(self.known_methods)
+            self.bank_encoder = LabelEncoder().fit(self.known_banks)
+            self.method_encoder = LabelEncoder().fit(self.known_methods)
+            self._cache_encoders()
             
             # Prepare features
             X, y = self._prepare_training_data(data)
             
             # Scale features
+            self.scaler = StandardScaler()
             X_scaled = self.scaler.fit_transform(X)
+            self._cache_scaler()
             
             # Train XGBoost
             self.model = XGBClassifier(
@@ -89,6 +215,9 @@ class FailurePredictor:
                 eval_metric='auc'
             )
             self.model.fit(X_scaled, y)
+            self._booster = self.model.get_booster()
+            self._onnx_model = self._convert_to_onnx()
+            self._load_onnx()
             
             self.is_trained = True
             
@@ -127,10 +256,9 @@ class FailurePredictor:
         """
         # Check cache
         cache_key = f"{bank}_{payment_method}"
-        if cache_key in self.prediction_cache:
-            cached = self.prediction_cache[cache_key]
-            if (datetime.now() - cached['timestamp']).seconds < self.cache_ttl_seconds:
-                return cached['prediction']
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            return cached
         
         # Calculate features
         features = self._calculate_prediction_features(
@@ -143,13 +271,83 @@ class FailurePredictor:
             prediction = self._rule_based_predict(features, bank_metrics)
         
         # Cache result
-        self.prediction_cache[cache_key] = {
-            'timestamp': datetime.now(),
-            'prediction': prediction
-        }
+        self._cache_put(cache_key, prediction)
         
         return prediction
     
+    def predict_failure_probability_batch(
+        self,
+        items: List[Tuple[str, str, Dict, Optional[Dict]]]
+    ) -> List[Dict]:
+        """
+        Predict failure probabilities for many bank/method combinations at once.
+        
+        Args:
+            items: (bank, payment_method, current_metrics, bank_metrics) tuples
+        
+        Returns:
+            Predictions in the same order as items
+        """
+        predictions: List[Optional[Dict]] = [None] * len(items)
+        misses = []
+        
+        for i, (bank, payment_method, _, _) in enumerate(items):
+            cached = self._cache_get(f"{bank}_{payment_method}")
+            if cached is not None:
+                predictions[i] = cached
+            else:
+                misses.append(i)
+        
+        if not misses:
+            return predictions
+        
+        features = [
+            self._calculate_prediction_features(*items[i]) for i in misses
+        ]
+        
+        if self.is_trained and self.model is not None:
+            fresh = self._ml_predict_batch(features)
+        else:
+            fresh = [
+                self._rule_based_predict(f, items[i][3])
+                for i, f in zip(misses, features)
+            ]
+        
+        for i, prediction in zip(misses, fresh):
+            bank, payment_method = items[i][0], items[i][1]
+            self._cache_put(f"{bank}_{payment_method}", prediction)
+            predictions[i] = prediction
+        
+        return predictions
+    
+    def invalidate_bank(self, bank: str):
+        """Drop cached predictions for every payment method of a bank"""
+        prefix = f"{bank}_"
+        with self._cache_lock:
+            for key in [k for k in self.prediction_cache if k.startswith(prefix)]:
+                del self.prediction_cache[key]
+    
+    def _cache_get(self, key: str) -> Optional[Dict]:
+        """Return a fresh cached prediction and mark it recently used"""
+        with self._cache_lock:
+            entry = self.prediction_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.prediction_cache[key]
+                return None
+            self.prediction_cache.move_to_end(key)
+            return entry[1]
+    
+    def _cache_put(self, key: str, prediction: Dict):
+        """Cache a prediction, evicting the least recently used entry when full"""
+        expires = time.monotonic() + self.cache_ttl_seconds
+        with self._cache_lock:
+            self.prediction_cache[key] = (expires, prediction)
+            self.prediction_cache.move_to_end(key)
+            if len(self.prediction_cache) > self.cache_max_size:
+                self.prediction_cache.popitem(last=False)
+    
     def predict_throttling_need(
         self,
         bank_metrics: List[Dict],
@@ -165,104 +363,96 @@ class FailurePredictor:
         Returns:
             List of throttling recommendations
         """
-        recommendations = []
-        
-        for bank in bank_metrics:
-            bank_name = bank.get('name', 'UNKNOWN')
-            success_rate = bank.get('success_rate', 100)
-            latency = bank.get('avg_latency', 200)
-            weight = bank.get('weight', 0)
-            
-            # Skip banks with no traffic
-            if weight == 0:
-                continue
-            
-            # Calculate load factor
-            load_factor = weight / 100  # Normalized
-            
-            # Trend analysis
-            trend = self._analyze_trend(bank_name)
-            
-            # Predict future state
-            predicted_success = success_rate + trend.get('success_rate_slope', 0) * time_horizon_minutes
-            predicted_latency = latency + trend.get('latency_slope', 0) * time_horizon_minutes
-            
-            # Risk assessment
-            risk_score = self._calculate_risk_score(
-                current_success=success_rate,
-                predicted_success=predicted_success,
-                current_latency=latency,
-                predicted_latency=predicted_latency,
-                load_factor=load_factor
+        # Skip banks with no traffic
+        active = [bank for bank in bank_metrics if bank.get('weight', 0) != 0]
+        if not active:
+            return []
+        
+        names = [bank.get('name', 'UNKNOWN') for bank in active]
+        success_rate = np.array([bank.get('success_rate', 100) for bank in active], dtype=np.float64)
+        latency = np.array([bank.get('avg_latency', 200) for bank in active], dtype=np.float64)
+        load_factor = np.array([bank['weight'] for bank in active], dtype=np.float64) / 100  # Normalized
+        
+        # Trend analysis
+        unknown = self._trend_idx['UNKNOWN']
+        slopes = self._trend[[self._trend_idx.get(name, unknown) for name in names]]
+        success_slope = slopes[:, 0]
+        latency_slope = slopes[:, 1]
+        
+        # Predict future state
+        predicted_success = success_rate + success_slope * time_horizon_minutes
+        predicted_latency = latency + latency_slope * time_horizon_minutes
+        
+        # Risk assessment, one column at a time
+        risk = np.where(predicted_success < 85, 0.4, np.where(predicted_success < 90, 0.2, 0.0))
+        decline = success_rate - predicted_success
+        risk += np.where(decline > 5, 0.3, np.where(decline > 2, 0.1, 0.0))
+        risk += np.where(predicted_latency > 500, 0.2, 0.0)
+        risk = np.minimum(1.0, risk * (1 + load_factor))
+        
+        risky = np.flatnonzero(risk > 0.5)
+        recommendations = [
+            {
+                'bank': names[i],
+                'risk_score': risk_score,
+                'action': 'reroute' if risk_score > 0.7 else 'reduce_traffic',
+                'percentage': min(90, int(risk_score * 100)),
+                'reason': f"Predicted success rate: {ps:.1f}%, latency: {pl:.0f}ms",
+                'urgency': 'high' if risk_score > 0.7 else 'medium',
+                'time_horizon_minutes': time_horizon_minutes
+            }
+            for i, risk_score, ps, pl in zip(
+                risky.tolist(),
+                risk[risky].tolist(),
+                predicted_success[risky].tolist(),
+                predicted_latency[risky].tolist()
             )
-            
-            if risk_score > 0.5:
-                action = 'reroute' if risk_score > 0.7 else 'reduce_traffic'
-                percentage = min(90, int(risk_score * 100))
-                
-                recommendations.append({
-                    'bank': bank_name,
-                    'risk_score': risk_score,
-                    'action': action,
-                    'percentage': percentage,
-                    'reason': f"Predicted success rate: {predicted_success:.1f}%, latency: {predicted_latency:.0f}ms",
-                    'urgency': 'high' if risk_score > 0.7 else 'medium',
-                    'time_horizon_minutes': time_horizon_minutes
-                })
+        ]
         
         # Sort by risk
         recommendations.sort(key=lambda x: x['risk_score'], reverse=True)
         
         return recommendations
     
-    def _prepare_training_data(self, data: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    def _prepare_training_data(self, data: "pd.DataFrame") -> Tuple[np.ndarray, np.ndarray]:
         """Prepare training data from raw transactions"""
-        features = []
-        labels = []
-        
-        for i in range(len(data)):
-            row = data.iloc[i]
-            
-            # Encode categorical
-            bank = row.get('bank', 'UNKNOWN')
-            bank = bank if bank in self.known_banks else 'UNKNOWN'
-            bank_encoded = self.bank_encoder.transform([bank])[0]
-            
-            method = row.get('payment_method', 'unknown')
-            method = method if method in self.known_methods else 'unknown'
-            method_encoded = self.method_encoder.transform([method])[0]
-            
-            # Time features
-            timestamp = pd.to_datetime(row.get('timestamp', datetime.now()))
-            hour = timestamp.hour
-            dow = timestamp.dayofweek
-            
-            # Rolling metrics (mock if not available)
-            recent_success = row.get('recent_success_rate', 95)
-            recent_latency = row.get('recent_latency', 200)
-            recent_volume = row.get('recent_volume', 10000)
-            bank_success = row.get('bank_success_rate', 95)
-            bank_latency = row.get('bank_latency', 200)
-            method_success = row.get('method_success_rate', 95)
-            
-            features.append([
-                bank_encoded,
-                method_encoded,
-                hour,
-                dow,
-                recent_success,
-                recent_latency,
-                recent_volume,
-                bank_success,
-                bank_latency,
-                method_success
-            ])
-            
-            # Label: 1 for failure, 0 for success
-            success = row.get('success', True)
-            labels.append(0 if success else 1)
-        
-        return np.array(features), np.array(labels)
+        import pandas as pd
+        
+        def column(name: str, default) -> pd.Series:
+            if name in data:
+                return data[name]
+            return pd.Series([default] * len(data), index=data.index)
+        
+        # Encode categorical (unknown values collapse to the catch-all class)
+        banks = column('bank', 'UNKNOWN')
+        banks = banks.where(banks.isin(self.known_banks), 'UNKNOWN')
+        bank_encoded = self.bank_encoder.transform(banks.to_numpy())
+        
+        methods = column('payment_method', 'unknown')
+        methods = methods.where(methods.isin(self.known_methods), 'unknown')
+        method_encoded = self.method_encoder.transform(methods.to_numpy())
+        
+        # Time features
+        timestamps = pd.to_datetime(column('timestamp', datetime.now()))
+        
+        # Rolling metrics (mock if not available)
+        features = np.column_stack([
+            bank_encoded,
+            method_encoded,
+            timestamps.dt.hour.to_numpy(),
+            timestamps.dt.dayofweek.to_numpy(),
+            column('recent_success_rate', 95).to_numpy(),
+            column('recent_latency', 200).to_numpy(),
+            column('recent_volume', 10000).to_numpy(),
+            column('bank_success_rate', 95).to_numpy(),
+            column('bank_latency', 200).to_numpy(),
+            column('method_success_rate', 95).to_numpy()
+        ]).astype(np.float32)
+        
+        # Label: 1 for failure, 0 for success
+        labels = (~column('success', True).astype(bool)).astype(np.int8).to_numpy()
+        
+        return features, labels
     
     def _calculate_prediction_features(
         self,
@@ -272,20 +462,20 @@ class FailurePredictor:
         bank_metrics: Optional[Dict]
     ) -> Dict:
         """Calculate features for prediction"""
-        now = datetime.now()
+        hour, weekday = self._hour_and_weekday()
         
         # Encode
         bank = bank if bank in self.known_banks else 'UNKNOWN'
         method = payment_method if payment_method in self.known_methods else 'unknown'
         
-        bank_encoded = self.bank_encoder.transform([bank])[0] if self.is_trained else 0
-        method_encoded = self.method_encoder.transform([method])[0] if self.is_trained else 0
+        bank_encoded = self._bank_idx.get(bank, self._bank_idx['UNKNOWN']) if self.is_trained else 0
+        method_encoded = self._method_idx.get(method, self._method_idx['unknown']) if self.is_trained else 0
         
         return {
             'bank_encoded': bank_encoded,
             'method_encoded': method_encoded,
-            'hour_of_day': now.hour,
-            'day_of_week': now.weekday(),
+            'hour_of_day': hour,
+            'day_of_week': weekday,
             'recent_success_rate': current_metrics.get('success_rate', 95),
             'recent_latency': current_metrics.get('avg_latency', 200),
             'recent_volume': current_metrics.get('transaction_volume', 10000),
@@ -294,45 +484,43 @@ class FailurePredictor:
             'method_success_rate': 95  # Would need method-specific tracking
         }
     
+    def _hour_and_weekday(self) -> Tuple[int, int]:
+        """Current local hour and weekday, re-read from the clock only when stale"""
+        mono = time.monotonic()
+        if mono >= self._clock_expires:
+            now = datetime.now()
+            self._clock = (now.hour, now.weekday())
+            self._clock_expires = mono + self.clock_ttl_seconds
+        return self._clock
+    
     def _ml_predict(self, features: Dict) -> Dict:
         """Make prediction using trained model"""
         try:
-            X = np.array([[
-                features['bank_encoded'],
-                features['method_encoded'],
-                features['hour_of_day'],
-                features['day_of_week'],
-                features['recent_success_rate'],
-                features['recent_latency'],
-                features['recent_volume'],
-                features['bank_success_rate'],
-                features['bank_latency'],
-                features['method_success_rate']
-            ]])
+            X_scaled = self._pred_buf
+            for i, name in enumerate(_FEATURE_ORDER):
+                X_scaled[0, i] = features[name]
             
-            X_scaled = self.scaler.transform(X)
+            # Scale in place; the buffer is refilled on every call
+            X_scaled -= self._mean
+            X_scaled *= self._inv_scale
             
-            # Get probability
-            proba = self.model.predict_proba(X_scaled)[0][1]  # Probability of failure
+            # Get probability of failure
+            if self.tl_predictor is not None:
+                proba = np.ravel(self.tl_predictor.predict(self._tl_dmatrix(X_scaled, dtype='float32')))[0]
+            elif self._onnx_session is not None:
+                # Outputs are (label, probabilities); column 1 is failure
+                proba = float(self._onnx_session.run(None, {'input': X_scaled})[1][0, 1])
+            else:
+                # binary:logistic, so this is already the failure probability
+                proba = float(self._booster.inplace_predict(X_scaled)[0])
             
             # Determine risk level
-            if proba > 0.7:
-                risk_level = 'critical'
-                recommendation = 'Immediately reroute traffic to backup'
-            elif proba > 0.5:
-                risk_level = 'high'
-                recommendation = 'Consider reducing traffic to this path'
-            elif proba > 0.3:
-                risk_level = 'medium'
-                recommendation = 'Monitor closely, prepare backup'
-            else:
-                risk_level = 'low'
-                recommendation = 'Normal operation'
+            i = int(np.searchsorted(_RISK_BINS, proba))
             
             return {
                 'failure_probability': float(proba),
-                'risk_level': risk_level,
-                'recommendation': recommendation,
+                'risk_level': _RISK_LEVELS[i],
+                'recommendation': _RISK_RECS[i],
                 'confidence': 0.85,  # Model confidence
                 'source': 'ml'
             }
@@ -341,121 +529,196 @@ class FailurePredictor:
             print(f"ML prediction error: {e}")
             return self._rule_based_predict(features, None)
     
+    def _ml_predict_batch(self, features: List[Dict]) -> List[Dict]:
+        """Make predictions for several feature rows with one model call"""
+        try:
+            X = np.empty((len(features), len(self.feature_columns)), dtype=np.float32)
+            for j, name in enumerate(_FEATURE_ORDER):
+                X[:, j] = [f[name] for f in features]
+            
+            X_scaled = (X - self._mean) * self._inv_scale
+            
+            if self.tl_predictor is not None:
+                proba = np.ravel(self.tl_predictor.predict(self._tl_dmatrix(X_scaled, dtype='float32')))
+            elif self._onnx_session is not None:
+                proba = self._onnx_session.run(None, {'input': X_scaled})[1][:, 1]
+            else:
+                proba = self._booster.inplace_predict(X_scaled)
+            
+            levels = np.searchsorted(_RISK_BINS, proba)
+            
+            return [
+                {
+                    'failure_probability': p,
+                    'risk_level': _RISK_LEVELS[i],
+                    'recommendation': _RISK_RECS[i],
+                    'confidence': 0.85,
+                    'source': 'ml'
+                }
+                for p, i in zip(proba.tolist(), levels.tolist())
+            ]
+            
+        except Exception as e:
+            print(f"ML batch prediction error: {e}")
+            return [self._rule_based_predict(f, None) for f in features]
+    
     def _rule_based_predict(self, features: Dict, bank_metrics: Optional[Dict]) -> Dict:
         """Rule-based fallback prediction"""
-        success_rate = features.get('bank_success_rate', 95)
-        latency = features.get('bank_latency', 200)
-        
-        # Simple risk calculation
-        risk = 0.0
-        
-        if success_rate < 90:
-            risk += 0.3
-        if success_rate < 80:
-            risk += 0.3
-        if latency > 400:
-            risk += 0.2
-        if latency > 600:
-            risk += 0.2
-        
-        # Time-based risk (higher during peak hours)
-        hour = features.get('hour_of_day', 12)
-        if 10 <= hour <= 14 or 18 <= hour <= 21:
-            risk += 0.1  # Peak hours
-        
-        risk = min(1.0, risk)
-        
-        if risk > 0.6:
-            risk_level = 'high'
-            recommendation = 'Consider traffic rerouting'
-        elif risk > 0.3:
-            risk_level = 'medium'
-            recommendation = 'Monitor closely'
-        else:
-            risk_level = 'low'
-            recommendation = 'Normal operation'
+        risk = _score_rule(
+            float(features.get('bank_success_rate', 95)),
+            float(features.get('bank_latency', 200)),
+            int(features.get('hour_of_day', 12))
+        )
+        
+        i = int(np.searchsorted(_RULE_RISK_BINS, risk))
         
         return {
             'failure_probability': risk,
-            'risk_level': risk_level,
-            'recommendation': recommendation,
+            'risk_level': _RULE_RISK_LEVELS[i],
+            'recommendation': _RULE_RISK_RECS[i],
             'confidence': 0.5,  # Lower confidence for rules
             'source': 'rule-based'
         }
     
-    def _analyze_trend(self, bank_name: str) -> Dict:
-        """Analyze trend for a bank (simplified)"""
-        # In production, this would use historical data
-        return {
-            'success_rate_slope': -0.1,  # Slight decline per minute
-            'latency_slope': 2  # Slight increase per minute
+    def _cache_encoders(self):
+        """Build label -> code maps from the fitted encoders"""
+        self._bank_idx = {
+            str(b): int(i) for b, i in zip(
+                self.bank_encoder.classes_,
+                self.bank_encoder.transform(self.bank_encoder.classes_)
+            )
+        }
+        self._method_idx = {
+            str(m): int(i) for m, i in zip(
+                self.method_encoder.classes_,
+                self.method_encoder.transform(self.method_encoder.classes_)
+            )
         }
     
-    def _calculate_risk_score(
-        self,
-        current_success: float,
-        predicted_success: float,
-        current_latency: float,
-        predicted_latency: float,
-        load_factor: float
-    ) -> float:
-        """Calculate composite risk score"""
-        risk = 0.0
-        
-        # Success rate risk
-        if predicted_success < 85:
-            risk += 0.4
-        elif predicted_success < 90:
-            risk += 0.2
-        
-        # Decline risk
-        decline = current_success - predicted_success
-        if decline > 5:
-            risk += 0.3
-        elif decline > 2:
-            risk += 0.1
-        
-        # Latency risk
-        if predicted_latency > 500:
-            risk += 0.2
-        
-        # Load amplification
-        risk *= (1 + load_factor)
-        
-        return min(1.0, risk)
+    def _cache_scaler(self):
+        """Keep the fitted scaler's parameters as float32 arrays"""
+        self._mean = self.scaler.mean_.astype(np.float32)
+        self._inv_scale = (1.0 / self.scaler.scale_).astype(np.float32)
     
     def _save_model(self):
         """Save model to disk"""
+        import joblib
+        
         try:
             os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
+            # The booster goes in XGBoost's own binary format next to the bundle
+            self.model.save_model(self._booster_path())
             joblib.dump({
-                'model': self.model,
                 'scaler': self.scaler,
                 'bank_encoder': self.bank_encoder,
-                'method_encoder': self.method_encoder
-            }, self.model_path)
+                'method_encoder': self.method_encoder,
+                'bank_idx': self._bank_idx,
+                'method_idx': self._method_idx,
+                'onnx': self._onnx_model
+            }, self.model_path, compress=MODEL_COMPRESSION)
             print(f"Model saved to {self.model_path}")
         except Exception as e:
             print(f"Failed to save model: {e}")
+        
+        self._compile_treelite()
+    
+    def _compile_treelite(self):
+        """Compile the booster to a shared library and load it for prediction"""
+        if not TREELITE_AVAILABLE:
+            return
+        try:
+            import treelite
+            import tl2cgen
+            
+            tl_model = treelite.frontend.from_xgboost(self.model.get_booster())
+            tl2cgen.export_lib(tl_model, toolchain='gcc', libpath=self.tl_libpath)
+            self._load_treelite()
+        except Exception as e:
+            print(f"Treelite compile failed, using XGBoost for inference: {e}")
+            self.tl_predictor = None
+    
+    def _convert_to_onnx(self) -> Optional[bytes]:
+        """Serialize the trained booster to ONNX (None if unavailable)"""
+        if not ONNX_AVAILABLE:
+            return None
+        try:
+            from onnxmltools import convert_xgboost
+            from onnxmltools.convert.common.data_types import FloatTensorType
+            
+            onx = convert_xgboost(
+                self.model,
+                initial_types=[('input', FloatTensorType([None, len(_FEATURE_ORDER)]))]
+            )
+            return onx.SerializeToString()
+        except Exception as e:
+            print(f"ONNX conversion failed, using XGBoost for inference: {e}")
+            return None
+    
+    def _load_onnx(self):
+        """Build an ONNX Runtime session from the exported model, if any"""
+        self._onnx_session = None
+        if ONNX_AVAILABLE and self._onnx_model:
+            try:
+                import onnxruntime as ort
+                
+                self._onnx_session = ort.InferenceSession(
+                    self._onnx_model, providers=['CPUExecutionProvider']
+                )
+            except Exception as e:
+                print(f"ONNX session failed, using XGBoost for inference: {e}")
+    
+    def _load_treelite(self):
+        """Load the compiled predictor if one exists on disk"""
+        self.tl_predictor = None
+        if TREELITE_AVAILABLE and os.path.exists(self.tl_libpath):
+            try:
+                import tl2cgen
+                
+                self.tl_predictor = tl2cgen.Predictor(self.tl_libpath)
+                self._tl_dmatrix = tl2cgen.DMatrix
+            except Exception as e:
+                print(f"Failed to load Treelite predictor: {e}")
+    
+    def _booster_path(self) -> str:
+        """Where the booster is saved alongside the joblib bundle"""
+        return os.path.splitext(self.model_path)[0] + '.ubj'
     
     def load_model(self) -> bool:
         """Load model from disk"""
         try:
             if os.path.exists(self.model_path):
+                import joblib
                 data = joblib.load(self.model_path)
-                self.model = data['model']
+                if 'model' in data:
+                    # Bundles saved before the booster was split out
+                    self.model = data['model']
+                else:
+                    from xgboost import XGBClassifier
+                    self.model = XGBClassifier()
+                    self.model.load_model(self._booster_path())
+                self._booster = self.model.get_booster()
                 self.scaler = data['scaler']
                 self.bank_encoder = data['bank_encoder']
                 self.method_encoder = data['method_encoder']
+                if 'bank_idx' in data:
+                    self._bank_idx = data['bank_idx']
+                    self._method_idx = data['method_idx']
+                else:
+                    self._cache_encoders()
+                self._onnx_model = data.get('onnx')
+                self._cache_scaler()
+                self._load_onnx()
+                self._load_treelite()
                 self.is_trained = True
                 print(f"Model loaded from {self.model_path}")
                 return True
         except Exception as e:
             print(f"Failed to load model: {e}")
         
-        # Initialize encoders even if model not loaded
-        self.bank_encoder.fit(self.known_banks)
-        self.method_encoder.fit(self.known_methods)
+        # Initialize the label maps even if model not loaded
+        # (the codes LabelEncoder assigns: position in sorted order)
+        self._bank_idx = {b: i for i, b in enumerate(sorted(self.known_banks))}
+        self._method_idx = {m: i for i, m in enumerate(sorted(self.known_methods))}
         return False
 
 
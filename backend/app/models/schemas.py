@@ -3,7 +3,7 @@ Pydantic Models / Schemas
 Data models for the Payment Operations system
 """
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
@@ -52,6 +52,9 @@ class SystemMetrics(BaseModel):
 
 class BankHealth(BaseModel):
     """Health status of a bank/issuer"""
+    # Not extra='forbid': bank dicts served through this model carry extras like ml_reason
+    model_config = ConfigDict(frozen=True)
+    
     name: str = Field(..., description="Bank identifier")
     display_name: str = Field(..., description="Friendly bank name")
     status: BankStatus = Field(default=BankStatus.HEALTHY)
@@ -74,6 +77,8 @@ class Anomaly(BaseModel):
 
 class Intervention(BaseModel):
     """Record of an agent intervention"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str = Field(..., description="Unique intervention ID")
     timestamp: str = Field(default_factory=lambda: datetime.now().isoformat())
     type: str = Field(..., description="Type of intervention")
@@ -105,6 +110,8 @@ class ApprovalRequest(BaseModel):
 
 class ErrorLog(BaseModel):
     """Transaction error log entry"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str
     code: str = Field(..., description="HTTP error code")
     description: str
@@ -119,6 +126,8 @@ class ErrorLog(BaseModel):
 
 class Transaction(BaseModel):
     """Individual payment transaction"""
+    model_config = ConfigDict(frozen=True, extra='forbid')
+    
     id: str
     amount: float = Field(..., gt=0)
     currency: str = Field(default="INR")
@@ -10,44 +10,201 @@ from sklearn.preprocessing import LabelEncoder
 from datetime import datetime
 import joblib
 import os
+import time
 import asyncio
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict, deque
 import shap
 import numpy as np
-from sklearn.linear_model import SGDRegressor
-from sklearn.preprocessing import StandardScaler
+import structlog
+
+logger = structlog.get_logger()
+
+# Optional: JIT-compile the rolling-window feature kernels used in training
+# and the policy learner's SGD kernels
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+# Optional: score large batches on the GPU when CuPy and a CUDA device are present
+try:
+    import cupy
+    CUDA_AVAILABLE = cupy.cuda.runtime.getDeviceCount() > 0
+except Exception:
+    CUDA_AVAILABLE = False
+
+
+@njit(cache=True)
+def _nan_mean(x: np.ndarray) -> float:
+    """Mean of the non-NaN values (NaN if none)"""
+    total = 0.0
+    count = 0
+    for v in x:
+        if not np.isnan(v):
+            total += v
+            count += 1
+    return total / count if count else np.nan
+
+
+@njit(cache=True)
+def _nan_quantile(x: np.ndarray, q: float, buf: np.ndarray) -> float:
+    """Linearly-interpolated quantile of the non-NaN values, as pandas computes it"""
+    count = 0
+    for v in x:
+        if not np.isnan(v):
+            buf[count] = v
+            count += 1
+    if count == 0:
+        return np.nan
+    values = np.sort(buf[:count])
+    pos = q * (count - 1)
+    lo = int(pos)
+    if lo == pos:
+        return values[lo]
+    return values[lo] + (values[lo + 1] - values[lo]) * (pos - lo)
+
+
+@njit(cache=True)
+def _rolling_features(
+    order: np.ndarray,
+    bounds: np.ndarray,
+    success: np.ndarray,
+    latency: np.ndarray,
+    retries: np.ndarray,
+    errors: np.ndarray
+) -> np.ndarray:
+    """
+    One sweep per bank computing, for each transaction, the rolling stats of the
+    bank's transactions before it: success rate (5), latency P90 (10),
+    retry depth (10) and distinct error codes (10). Columns in that order;
+    a bank's first transaction gets zeros. `errors` holds integer codes
+    (negative = no error); distinct codes are counted with a sliding histogram.
+    """
+    out = np.zeros((len(success), 4))
+    buf = np.empty(10)
+    code_counts = np.zeros(max(errors.max() + 1, 0) if len(errors) else 0, dtype=np.int64)
+    for g in range(len(bounds) - 1):
+        rows = order[bounds[g]:bounds[g + 1]]
+        bank_success = success[rows]
+        bank_latency = latency[rows]
+        bank_retries = retries[rows]
+        bank_errors = errors[rows]
+        code_counts[:] = 0
+        distinct = 0
+        
+        # Row k+1 sees the window ending at row k (no leakage)
+        for k in range(len(rows) - 1):
+            end = k + 1
+            start5 = max(0, end - 5)
+            start10 = max(0, end - 10)
+            target = rows[end]
+            
+            # Slide the error-code window: row k enters, row k-10 leaves
+            code = bank_errors[k]
+            if code >= 0:
+                if code_counts[code] == 0:
+                    distinct += 1
+                code_counts[code] += 1
+            if k >= 10:
+                code = bank_errors[k - 10]
+                if code >= 0:
+                    code_counts[code] -= 1
+                    if code_counts[code] == 0:
+                        distinct -= 1
+            
+            v = _nan_mean(bank_success[start5:end])
+            out[target, 0] = 1.0 if np.isnan(v) else v
+            v = _nan_quantile(bank_latency[start10:end], 0.9, buf)
+            out[target, 1] = 200.0 if np.isnan(v) else v
+            v = _nan_mean(bank_retries[start10:end])
+            out[target, 2] = 0.0 if np.isnan(v) else v
+            out[target, 3] = distinct
+    return out
+
+
+@njit(cache=True)
+def _encode_policy_features(x: np.ndarray, risk_score: float, bank_health: float, action_id: int):
+    """Write [risk, health, one-hot action] into x (action_id -1 = unknown action)"""
+    x[:] = 0.0
+    x[0] = risk_score
+    x[1] = bank_health
+    if action_id >= 0:
+        x[2 + action_id] = 1.0
+
+
+@njit(cache=True)
+def _policy_predict(w: np.ndarray, b: float, x: np.ndarray) -> float:
+    """Linear utility estimate w.x + b"""
+    p = b
+    for i in range(len(x)):
+        p += w[i] * x[i]
+    return p
+
+
+@njit(cache=True)
+def _policy_sgd_step(
+    w: np.ndarray, b: float, x: np.ndarray, reward: float, eta: float, alpha: float
+) -> float:
+    """
+    One squared-loss SGD step with L2 shrinkage, in the order sklearn's plain SGD
+    applies it. Updates w in place and returns the new intercept.
+    """
+    dloss = _policy_predict(w, b, x) - reward
+    dloss = min(max(dloss, -1e12), 1e12)
+    update = -eta * dloss
+    shrink = max(0.0, 1.0 - eta * alpha)
+    for i in range(len(x)):
+        w[i] = w[i] * shrink + update * x[i]
+    return b + update
+
+
+def _bank_groups(banks: pd.Series) -> tuple:
+    """
+    (order, bounds): positional rows sorted by bank, keeping the frame's row order
+    within a bank; bank g owns order[bounds[g]:bounds[g + 1]].
+    """
+    codes, uniques = pd.factorize(banks)
+    order = np.argsort(codes, kind='stable')
+    # Rows with a missing bank (code -1) sort first and fall outside every group
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return order, bounds
 
 class PolicyLearner:
     """
     Contextual Bandit Policy Learner.
     Learns to predict the Utility (Reward) of an action given the context.
-    Uses SGDRegressor for online learning (partial_fit).
+    Online linear regression by plain SGD (squared loss, L2, constant learning
+    rate - what SGDRegressor.partial_fit does), with JIT-compiled kernels.
     """
     def __init__(self):
         # We start with a simple linear model: Reward ~ w * (Context + Action)
-        # Context dimensions: [RiskScore, BankHealth, IsActionRetry, IsActionSwitch, IsActionAlert, IsActionMonitor]
-        self.model = SGDRegressor(learning_rate='constant', eta0=0.01)
-        self.scaler = StandardScaler()
+        # Context dimensions: [RiskScore, BankHealth, IsActionMonitor, IsActionRetry, IsActionSwitch, IsActionAlert]
+        self.learning_rate = 0.01
+        self.alpha = 0.0001  # L2 regularization
         self.is_trained = False
         
         # Action IDs for encoding
         self.actions = ["monitor", "retry", "switch_gateway", "send_alert"]
         self.action_map = {a: i for i, a in enumerate(self.actions)}
         
-    def _encode_context(self, context: dict, action_name: str) -> np.ndarray:
-        """Encode context and action into a feature vector"""
-        # Feature 1: Risk Score (0-1)
-        risk_score = context.get("risk_score", 0.0)
-        
-        # Feature 2: Bank Health (0-100 normalized to 0-1)
-        bank_health = context.get("bank_health_score", 100.0) / 100.0
+        self.w = np.zeros(2 + len(self.actions))
+        self.b = 0.0
+        self._x = np.zeros(2 + len(self.actions))  # Feature buffer, reused per call
         
-        # One-hot encode action
-        action_vec = [0] * len(self.actions)
-        if action_name in self.action_map:
-            action_vec[self.action_map[action_name]] = 1
-            
-        return np.array([risk_score, bank_health] + action_vec).reshape(1, -1)
+    def _encode_context(self, context: dict, action_name: str) -> np.ndarray:
+        """
+        Encode context and action into the feature buffer.
+        Every feature is already in [0, 1], so no input scaling is needed.
+        """
+        _encode_policy_features(
+            self._x,
+            context.get("risk_score", 0.0),  # Feature 1: Risk Score (0-1)
+            context.get("bank_health_score", 100.0) / 100.0,  # Feature 2: Bank Health (0-100 normalized to 0-1)
+            self.action_map.get(action_name, -1)  # One-hot encoded action
+        )
+        return self._x
 
     def predict_utility(self, context: dict, action_name: str) -> float:
         """Predict expected utility/reward for an action in this context"""
@@ -55,41 +212,78 @@ class PolicyLearner:
             return 0.0
             
         features = self._encode_context(context, action_name)
-        return float(self.model.predict(features)[0])
+        return float(_policy_predict(self.w, self.b, features))
         
     def update_policy(self, context: dict, action_name: str, reward: float):
         """Update model with observed reward (Online Learning)"""
         features = self._encode_context(context, action_name)
         
-        # SGDRegressor.partial_fit expects arrays
-        self.model.partial_fit(features, [reward])
+        self.b = _policy_sgd_step(
+            self.w, self.b, features, float(reward), self.learning_rate, self.alpha
+        )
         self.is_trained = True
-        print(f"  🧠 Policy Updated: {action_name} | Reward: {reward:.2f}")
+        logger.info("  🧠 Policy Updated: %s | Reward: %.2f", action_name, reward)
 
 class MLService:
     def __init__(self):
         self.model: Optional[xgb.XGBClassifier] = None
+        self._booster: Optional[xgb.Booster] = None  # self.model's Booster, for inference
+        self._gpu_booster: Optional[xgb.Booster] = None  # CUDA copy, if a GPU is available
+        self.gpu_min_rows = 256  # Below this, host->device transfer costs more than it saves
+        
+        # Scoring errors repeat every tick during a failure storm: log at most
+        # error_log_rate per second, without tracebacks
+        self.error_log_rate = 10
+        self._error_log_times: deque = deque()
+        
+        # LRU of quantized bank context -> (risk, reason); bank stats drift slowly,
+        # so most monitoring ticks can skip the predict + SHAP pass
+        self._explain_cache: "OrderedDict[Tuple, Tuple[float, str]]" = OrderedDict()
+        self.explain_cache_size = 1024
         self.explainer: Optional[shap.TreeExplainer] = None
         self.policy: PolicyLearner = PolicyLearner() # Initialize Policy Learner
         self.encoders: Dict[str, LabelEncoder] = {}
+        # Label -> code maps mirroring the encoders (unseen labels encode as 0)
+        self._bank_to_code: Dict[str, int] = {}
+        self._method_to_code: Dict[str, int] = {}
+        self.known_banks: frozenset = frozenset()
         self.is_ready = False
         self.model_path = "app/models/failure_predictor.json"
         self.data_path = "../data/historical_payments.csv"
         
+        # Trained model cache, reused on startup while younger than the TTL
+        # (and newer than the training data)
+        self.model_cache_path = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "models", "failure_predictor.joblib"
+        )
+        self.model_cache_ttl = float(os.getenv("ML_MODEL_CACHE_TTL", 24 * 3600))
+        
         # Advanced Features
         self.feature_columns = [
             'bank_encoded', 'method_encoded', 'hour', 'amount',
             'rolling_success_rate_5m', 'latency_p90', 'retry_depth', 'error_entropy'
         ]
         
+        # Single-row input buffer: C-contiguous float32 is XGBoost's no-copy fast path
+        self._scratch = np.zeros((1, len(self.feature_columns)), dtype=np.float32)
+        # Batch input buffer, grown on demand and reused across ticks
+        self._risk_buf = np.zeros((16, len(self.feature_columns)), dtype=np.float32)
+        
+        # (expires_at, hour): wall-clock hour feature, valid until the next hour boundary
+        self._hour_cache: Tuple[float, int] = (0.0, 0)
+        
     async def train_model(self):
-        """Train XGBoost model + Initialize Policy"""
+        """Train XGBoost model + Initialize Policy (off the event loop)"""
+        await asyncio.to_thread(self._train_model_sync)
+    
+    def _train_model_sync(self):
+        """Blocking body of train_model"""
         try:
-            print("🧠 Starting ML Model Training (Advanced Features + SHAP)...")
+            logger.info("🧠 Starting ML Model Training (Advanced Features + SHAP)...")
             
             # Pre-train the policy with some heuristic examples so it's not totally random
             # (Bootstrapping the bandit)
-            print("  🤖 Bootstrapping Policy Learner...")
+            logger.info("  🤖 Bootstrapping Policy Learner...")
             
             # Example 1: High Risk -> Switch is good
             ctx_high_risk = {"risk_score": 0.9, "bank_health_score": 20}
@@ -103,7 +297,10 @@ class MLService:
             
             # Load data
             if not os.path.exists(self.data_path):
-                print(f"⚠️ Training data not found at {self.data_path}")
+                logger.warning("⚠️ Training data not found at %s", self.data_path)
+                return
+            
+            if self._load_cached_model():
                 return
                 
             df = pd.read_csv(self.data_path)
@@ -113,10 +310,12 @@ class MLService:
             le_bank = LabelEncoder()
             df['bank_encoded'] = le_bank.fit_transform(df['bank'])
             self.encoders['bank'] = le_bank
+            self.known_banks = frozenset(str(b) for b in le_bank.classes_)
             
             le_method = LabelEncoder()
             df['method_encoded'] = le_method.fit_transform(df['payment_method'])
             self.encoders['method'] = le_method
+            self._cache_encoder_codes()
             
             # 2. Advanced Feature Engineering
             df['timestamp'] = pd.to_datetime(df['timestamp'])
@@ -126,39 +325,29 @@ class MLService:
             # Rolling Metrics (simulated for training based on bank-level history)
             # In a real system, this would be complex window functions.
             # Simplified for hackathon: calculate simulated rolling stats
-            
-            # Rolling Success Rate (5m)
             df['success_int'] = (df['status'] == 'success').astype(int)
-            # Group by bank to get bank-specific rolling stats
-            df['rolling_success_rate_5m'] = df.groupby('bank')['success_int'].transform(
-                lambda x: x.rolling(window=5, min_periods=1).mean()
-            ).fillna(1.0)
-            
-            # Latency P90 (rolling 10 txn window)
-            df['latency_p90'] = df.groupby('bank')['latency_ms'].transform(
-                lambda x: x.rolling(window=10, min_periods=1).quantile(0.9)
-            ).fillna(200)
-            
-            # Retry Depth (Avg retry count rolling)
-            df['retry_depth'] = df.groupby('bank')['retry_count'].transform(
-                lambda x: x.rolling(window=10, min_periods=1).mean()
-            ).fillna(0)
-            
-            # Error Entropy (Diversity of errors) - Simplified: Just unique error count in window
-            df['error_entropy'] = df.groupby('bank')['error_code'].transform(
-                lambda x: x.rolling(window=10, min_periods=1).apply(lambda y: len(pd.unique(y.dropna())))
-            ).fillna(0)
-
-            # Shift features to prevent leakage (we predict NEXT transaction based on PAST window)
-            feature_cols_to_shift = ['rolling_success_rate_5m', 'latency_p90', 'retry_depth', 'error_entropy']
-            df[feature_cols_to_shift] = df.groupby('bank')[feature_cols_to_shift].shift(1).fillna(0)
+            
+            # Each bank's rows, in time order; windows never cross banks
+            order, bounds = _bank_groups(df['bank'])
+            rolling = _rolling_features(
+                order,
+                bounds,
+                df['success_int'].to_numpy(dtype=np.float64),
+                df['latency_ms'].to_numpy(dtype=np.float64),
+                df['retry_count'].to_numpy(dtype=np.float64),
+                pd.factorize(df['error_code'])[0]  # -1 = no error
+            )
+            
+            # Shifted to prevent leakage (we predict NEXT transaction based on PAST window)
+            df[['rolling_success_rate_5m', 'latency_p90', 'retry_depth', 'error_entropy']] = rolling
             
             # 3. Target Variable
             df['target'] = (df['status'] == 'failed').astype(int)
             
-            # Select features
-            X = df[self.feature_columns]
-            y = df['target']
+            # Select features: C-contiguous float32 is XGBoost's no-copy DMatrix path
+            X = np.ascontiguousarray(df[self.feature_columns].to_numpy(dtype=np.float32))
+            y = df['target'].to_numpy(dtype=np.int32)
+            assert X.flags.c_contiguous and X.dtype == np.float32
             
             # Train/Test Split
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -172,97 +361,189 @@ class MLService:
                 eval_metric='logloss'
             )
             self.model.fit(X_train, y_train)
+            self._attach_booster()
+            self._explain_cache.clear()
             
             # Initialize SHAP Explainer
-            print("  📊 Initializing SHAP Explainer...")
+            logger.info("  📊 Initializing SHAP Explainer...")
             self.explainer = shap.TreeExplainer(self.model)
             
             # Evaluate
             accuracy = self.model.score(X_test, y_test)
-            print(f"✅ ML Model Trained! Accuracy: {accuracy:.2f}")
+            logger.info("✅ ML Model Trained! Accuracy: %.2f", accuracy)
             
             self.is_ready = True
+            self._save_cached_model()
             
         except Exception as e:
-            print(f"❌ ML Training Failed: {e}")
+            logger.exception("❌ ML Training Failed: %s", e)
             self.is_ready = False
-            import traceback
-            traceback.print_exc()
 
+    def _load_cached_model(self) -> bool:
+        """Restore a fresh cached model instead of retraining"""
+        try:
+            if not os.path.exists(self.model_cache_path):
+                return False
+            
+            cached_at = os.path.getmtime(self.model_cache_path)
+            if time.time() - cached_at > self.model_cache_ttl:
+                return False
+            if os.path.getmtime(self.data_path) > cached_at:
+                return False
+            
+            data = joblib.load(self.model_cache_path)
+            self.model = data['model']
+            self._attach_booster()
+            self._explain_cache.clear()
+            self.encoders = data['encoders']
+            self._cache_encoder_codes()
+            self.known_banks = data['known_banks']
+            self.explainer = shap.TreeExplainer(self.model)
+            self.is_ready = True
+            logger.info("✅ ML Model loaded from cache (%s)", self.model_cache_path)
+            return True
+        except Exception as e:
+            logger.warning("⚠️ Could not load cached model, retraining: %s", e)
+            return False
+    
+    def _save_cached_model(self):
+        """Persist the trained model for the next startup"""
+        try:
+            os.makedirs(os.path.dirname(self.model_cache_path), exist_ok=True)
+            joblib.dump({
+                'model': self.model,
+                'encoders': self.encoders,
+                'known_banks': self.known_banks
+            }, self.model_cache_path, compress=3)
+        except Exception as e:
+            logger.warning("⚠️ Could not cache trained model: %s", e)
+    
     def predict_failure_probability(self, context: dict) -> float:
         """Predict prob with context"""
         if not self.is_ready or not self.model:
             return 0.0
         
         try:
-            input_df = self._prepare_input(context)
-            return float(self.model.predict_proba(input_df)[0][1])
+            return float(self._predict_proba(self._prepare_input(context))[0])
         except Exception as e:
-            print(f"⚠️ Prediction Error: {e}")
+            self._log_error("⚠️ Prediction Error", e)
             return 0.0
             
+    def _log_error(self, message: str, error: Exception):
+        """Warn about a scoring failure unless error_log_rate was hit in the last second"""
+        now = time.monotonic()
+        times = self._error_log_times
+        while times and now - times[0] > 1.0:
+            times.popleft()
+        if len(times) >= self.error_log_rate:
+            return
+        times.append(now)
+        logger.warning(message, error=str(error))
+    
+    def _attach_booster(self):
+        """Cache self.model's Booster (plus a CUDA copy when a GPU is present)"""
+        self._booster = self.model.get_booster()
+        self._gpu_booster = None
+        if CUDA_AVAILABLE:
+            try:
+                self._gpu_booster = self._booster.copy()
+                self._gpu_booster.set_param({'device': 'cuda'})
+            except Exception as e:
+                logger.warning("⚠️ GPU predictor unavailable, using CPU: %s", e)
+                self._gpu_booster = None
+    
+    def _predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Failure probability per row of a float32 feature matrix"""
+        if self._gpu_booster is not None and len(X) >= self.gpu_min_rows:
+            return self._gpu_booster.inplace_predict(cupy.asarray(X)).get()
+        if self._booster is not None:
+            # binary:logistic, so inplace_predict already returns P(failure)
+            return self._booster.inplace_predict(X)
+        return self.model.predict_proba(X)[:, 1]
+    
     def explain_prediction(self, context: dict) -> str:
         """Get SHAP-based explanation for prediction"""
         if not self.is_ready or not self.explainer:
             return ""
             
         try:
-            input_df = self._prepare_input(context)
-            shap_values = self.explainer.shap_values(input_df)
+            X = self._prepare_input(context)
+            shap_values = self.explainer.shap_values(X)
             
             # Handle standard SHAP output (list for classification) vs newer object
             if isinstance(shap_values, list): 
                 shap_values = shap_values[1] # Class 1 (Failure)
                 
-            # Get top 3 features contributing to failure (positive SHAP values)
-            feature_names = self.feature_columns
-            contributions = zip(feature_names, shap_values[0])
-            
-            # Sort by absolute contribution or just positive contribution?
-            # We want to know why it FAILED (positive contribution to class 1)
-            sorted_contribs = sorted(contributions, key=lambda x: x[1], reverse=True)
-            
-            reasons = []
-            for name, val in sorted_contribs[:3]:
-                if val > 0.01: # Only significant positive contributors
-                    reasons.append(f"{name} (+{val:.2f})")
-            
-            if not reasons:
-                return "Baseline Risk"
-                
-            return ", ".join(reasons)
+            return self._format_reasons(shap_values[0])
             
         except Exception as e:
-            print(f"⚠️ Explainability Error: {e}")
+            self._log_error("⚠️ Explainability Error", e)
             return "Analysis Failed"
-
-    def _prepare_input(self, context: dict) -> pd.DataFrame:
-        """Helper to prepare input DataFrame"""
-        bank = context.get('bank', 'HDFC')
-        method = context.get('method', 'upi')
+    
+    def _format_reasons(self, shap_row) -> str:
+        """Describe the top 3 features contributing to failure for one row of SHAP values"""
+        contributions = zip(self.feature_columns, shap_row)
         
-        # Encode inputs
-        try:
-            bank_enc = self.encoders['bank'].transform([bank])[0]
-        except:
-            bank_enc = 0
+        # Sort by absolute contribution or just positive contribution?
+        # We want to know why it FAILED (positive contribution to class 1)
+        sorted_contribs = sorted(contributions, key=lambda x: x[1], reverse=True)
+        
+        reasons = []
+        for name, val in sorted_contribs[:3]:
+            if val > 0.01: # Only significant positive contributors
+                reasons.append(f"{name} (+{val:.2f})")
+        
+        if not reasons:
+            return "Baseline Risk"
             
-        try:
-            method_enc = self.encoders['method'].transform([method])[0]
-        except:
-            method_enc = 0
-            
-        return pd.DataFrame([{
-            'bank_encoded': bank_enc,
-            'method_encoded': method_enc,
-            'hour': datetime.now().hour,
-            'amount': context.get('amount', 1000.0),
-            'rolling_success_rate_5m': context.get('rolling_success_rate', 0.95),
-            'latency_p90': context.get('latency_p90', 200),
-            'retry_depth': context.get('retry_depth', 0.1),
-            'error_entropy': context.get('error_entropy', 0.5)
-        }])
+        return ", ".join(reasons)
 
+    def _cache_encoder_codes(self):
+        """Build label -> code maps from the fitted encoders"""
+        self._bank_to_code = {str(c): i for i, c in enumerate(self.encoders['bank'].classes_)}
+        self._method_to_code = {str(c): i for i, c in enumerate(self.encoders['method'].classes_)}
+    
+    def _fill_row(self, row: np.ndarray, context: dict, hour: int):
+        """Write one context's features into a row, in feature_columns order"""
+        row[:] = (
+            self._bank_to_code.get(context.get('bank', 'HDFC'), 0),
+            self._method_to_code.get(context.get('method', 'upi'), 0),
+            hour,
+            context.get('amount', 1000.0),
+            context.get('rolling_success_rate', 0.95),
+            context.get('latency_p90', 200),
+            context.get('retry_depth', 0.1),
+            context.get('error_entropy', 0.5)
+        )
+    
+    def _current_hour(self) -> int:
+        """Current hour of day, re-read from the clock only once per hour"""
+        expires_at, hour = self._hour_cache
+        now = time.time()
+        if now >= expires_at:
+            dt = datetime.fromtimestamp(now)
+            hour = dt.hour
+            expires_at = now + 3600 - (dt.minute * 60 + dt.second + dt.microsecond / 1e6)
+            self._hour_cache = (expires_at, hour)
+        return hour
+    
+    def _prepare_inputs(self, contexts: List[dict], hour: int) -> np.ndarray:
+        """Fill the shared float32 input buffer with a row per context (valid until the next call)"""
+        if len(contexts) > len(self._risk_buf):
+            self._risk_buf = np.zeros(
+                (max(len(contexts), 2 * len(self._risk_buf)), len(self.feature_columns)),
+                dtype=np.float32
+            )
+        rows = self._risk_buf[:len(contexts)]
+        for i, context in enumerate(contexts):
+            self._fill_row(rows[i], context, hour)
+        return rows
+    
+    def _prepare_input(self, context: dict) -> np.ndarray:
+        """Helper to prepare a single-row input (reuses the scratch buffer)"""
+        self._fill_row(self._scratch[0], context, self._current_hour())
+        return self._scratch
+    
     def get_bank_risk_scores(self, current_stats: Dict = None) -> Dict[str, Dict]:
         """
         Get risk scores AND explanations for all banks.
@@ -272,43 +553,138 @@ class MLService:
         if not self.is_ready:
             return {}
             
-        risks = {}
         try:
-            for bank in self.encoders['bank'].classes_:
-                bank_str = str(bank)
-                
-                # Default context (healthy)
-                context = {
-                    'bank': bank_str,
-                    'method': 'upi',
-                    'amount': 2500.0,
-                    'rolling_success_rate': 0.98,
-                    'latency_p90': 180,
-                    'retry_depth': 0.05,
-                    'error_entropy': 0.1
-                }
-                
-                # If we have real stats, use them
-                if current_stats and bank_str in current_stats:
-                     stats = current_stats[bank_str]
-                     context.update({
-                         'rolling_success_rate': stats.get('success_rate', 98) / 100.0,
-                         'latency_p90': stats.get('avg_latency', 180) * 1.5, # P90 heuristic
-                         'retry_depth': 0.1, # Not tracked in simple stats yet
-                         'error_entropy': 0.2
-                     })
-                
-                prob = self.predict_failure_probability(context)
-                reason = self.explain_prediction(context) if prob > 0.4 else "Healthy"
-                
-                risks[bank_str] = {
-                    "risk": round(prob, 4), 
-                    "reason": reason
-                }
-                
-            return risks
+            banks = [str(bank) for bank in self.encoders['bank'].classes_]
+            scores = self._score_banks([
+                (bank, current_stats.get(bank) if current_stats else None)
+                for bank in banks
+            ])
+            
+            return {
+                bank: {"risk": prob, "reason": reason}
+                for bank, (prob, reason) in zip(banks, scores)
+            }
         except Exception as e:
-            print(f"risk score calc error: {e}")
-            import traceback
-            traceback.print_exc()
+            self._log_error("risk score calc error", e)
             return {}
+    
+    def get_bank_risk_list(self, banks: List[dict]) -> List[tuple]:
+        """
+        Get (risk, reason) for each bank health entry, aligned with `banks`.
+        Banks the model wasn't trained on get (0.0, "").
+        """
+        if not self.is_ready:
+            return [(0.0, "")] * len(banks)
+        
+        known_banks = self.known_banks
+        try:
+            known = [i for i, bank in enumerate(banks) if bank.get("name") in known_banks]
+            scores = self._score_banks([(banks[i]["name"], banks[i]) for i in known])
+            
+            results = [(0.0, "")] * len(banks)
+            for i, score in zip(known, scores):
+                results[i] = score
+            return results
+        except Exception as e:
+            self._log_error("risk score calc error", e)
+            return [(0.0, "")] * len(banks)
+    
+    def _score_banks(self, items: List[tuple]) -> List[tuple]:
+        """
+        Predict (risk, reason) for (bank, stats) pairs, reusing cached results for
+        contexts that quantize to one already scored this hour.
+        """
+        hour = self._current_hour()
+        contexts = [self._bank_context(bank, stats) for bank, stats in items]
+        keys = [
+            (
+                c['bank'], hour,
+                round(c['rolling_success_rate'], 2),
+                round(c['latency_p90']),
+                round(c['retry_depth'], 2),
+                round(c['error_entropy'], 2)
+            )
+            for c in contexts
+        ]
+        
+        cache = self._explain_cache
+        results: List[Optional[tuple]] = [None] * len(items)
+        misses = []
+        for i, key in enumerate(keys):
+            if key in cache:
+                cache.move_to_end(key)
+                results[i] = cache[key]
+            else:
+                misses.append(i)
+        
+        if misses:
+            scored, ok = self._score_contexts([contexts[i] for i in misses], hour)
+            for i, result in zip(misses, scored):
+                results[i] = result
+                # Fallback results from a failed predict/explain are not cached,
+                # so the next tick retries instead of reusing them all hour
+                if ok:
+                    cache[keys[i]] = result
+            while len(cache) > self.explain_cache_size:
+                cache.popitem(last=False)
+        
+        return results
+    
+    def _score_contexts(self, contexts: List[dict], hour: int) -> Tuple[List[tuple], bool]:
+        """
+        Predict (risk, reason) for contexts with one predict_proba call
+        and one SHAP call covering the risky ones.
+        Also returns whether both calls succeeded.
+        """
+        X = self._prepare_inputs(contexts, hour)
+        ok = True
+        
+        try:
+            probs = self._predict_proba(X)
+        except Exception as e:
+            self._log_error("⚠️ Prediction Error", e)
+            probs = np.zeros(len(contexts))
+            ok = False
+        
+        reasons = ["Healthy"] * len(contexts)
+        risky = np.flatnonzero(probs > 0.4)
+        if risky.size:
+            try:
+                if not self.explainer:
+                    raise RuntimeError("SHAP explainer not initialized")
+                shap_values = self.explainer.shap_values(X[risky])
+                if isinstance(shap_values, list):
+                    shap_values = shap_values[1] # Class 1 (Failure)
+                for row, i in enumerate(risky):
+                    reasons[i] = self._format_reasons(shap_values[row])
+            except Exception as e:
+                self._log_error("⚠️ Explainability Error", e)
+                for i in risky:
+                    reasons[i] = "Analysis Failed"
+                ok = False
+        
+        return [(round(float(prob), 4), reason) for prob, reason in zip(probs, reasons)], ok
+    
+    def _bank_context(self, bank: str, stats: Optional[dict]) -> dict:
+        """Prediction context for one bank from its current stats"""
+        # Default context (healthy)
+        context = {
+            'bank': bank,
+            'method': 'upi',
+            'amount': 2500.0,
+            'rolling_success_rate': 0.98,
+            'latency_p90': 180,
+            'retry_depth': 0.05,
+            'error_entropy': 0.1
+        }
+        
+        # If we have real stats, use them
+        if stats:
+            context.update({
+                'rolling_success_rate': stats.get('success_rate', 98) / 100.0,
+                'latency_p90': stats.get('avg_latency', 180) * 1.5, # P90 heuristic
+                'retry_depth': 0.1, # Not tracked in simple stats yet
+                'error_entropy': 0.2
+            })
+        
+        return context
@@ -4,10 +4,11 @@ Handles Redis Streams for transaction data
 """
 
 import redis.asyncio as redis
-import json
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+import orjson
+from functools import partial
+from typing import Optional, List, Dict, Callable
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -28,12 +29,37 @@ class RedisService:
         self.TRANSACTIONS_STREAM = "transactions"
         self.METRICS_STREAM = "metrics"
         self.ALERTS_STREAM = "alerts"
+        self.MEMORY_STREAM = "agent:memories"
         
         # Key prefixes
         self.METRICS_KEY = "current:metrics"
         self.BANK_HEALTH_KEY = "current:banks"
         self.CONFIG_KEY = "config"
-        self.MEMORY_KEY = "agent:memory"
+        self.MEMORY_TYPE_KEY = "agent:memories:type"  # Set of memory stream ids per anomaly type
+        # Pre-stream memory hash and its mem_<ts> id sets, migrated on connect
+        self.LEGACY_MEMORY_KEY = "agent:memory"
+        self.LEGACY_MEMORY_TYPE_KEY = "agent:memory:type"
+        
+        # Pub/sub channels pushed to the dashboard (channel name = message type)
+        self.METRICS_CHANNEL = "metrics"
+        self.BANKS_CHANNEL = "banks"
+        
+        # Cap on dashboard pushes per channel. The simulator's default 1s tick
+        # stays under it; it only thins out publishes when tick_interval is
+        # lowered or metrics are written between ticks
+        self.publish_interval = 1.0
+        self._last_published: Dict[str, float] = {}
+        
+        # Callbacks notified whenever a fresh metrics sample is written
+        self.metrics_listeners: List[Callable[[dict], None]] = []
+        
+        # Pipelined write counters (see pipeline_avg_cmds)
+        self._pipeline_batches = 0
+        self._pipeline_commands = 0
+        
+        # Payload codec for every stream/list/hash value (numpy scalars show up in metrics)
+        self._dumps = partial(orjson.dumps, option=orjson.OPT_SERIALIZE_NUMPY)
+        self._loads = orjson.loads
     
     async def connect(self):
         """Establish Redis connection"""
@@ -46,6 +72,7 @@ class RedisService:
             await self.client.ping()
             self.is_connected = True
             print(f"✅ Connected to Redis at {self.redis_url}")
+            await self._migrate_legacy_memories()
         except Exception as e:
             print(f"⚠️ Redis connection failed: {e}. Running in simulation mode.")
             self.is_connected = False
@@ -64,16 +91,10 @@ class RedisService:
             return ""
         
         try:
-            # Filter out None values - Redis can't handle them
-            clean_transaction = {
-                k: str(v) for k, v in transaction.items() 
-                if v is not None
-            }
-            
             # Add to stream
             msg_id = await self.client.xadd(
                 self.TRANSACTIONS_STREAM,
-                clean_transaction,
+                self._clean_transaction(transaction),
                 maxlen=10000  # Keep last 10k transactions
             )
             return msg_id
@@ -81,6 +102,36 @@ class RedisService:
             print(f"Redis add_transaction error: {e}")
             return ""
     
+    async def add_transactions_bulk(self, transactions: List[dict]) -> List[str]:
+        """Add a batch of transactions to the stream in a single round trip"""
+        if not self.is_connected or not transactions:
+            return []
+        
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                self._queue_transactions(pipe, transactions)
+                return await self._execute(pipe)
+        except Exception as e:
+            print(f"Redis add_transactions_bulk error: {e}")
+            return []
+    
+    def _queue_transactions(self, pipe, transactions: List[dict]):
+        """Queue one stream XADD per transaction on a pipeline"""
+        for transaction in transactions:
+            pipe.xadd(
+                self.TRANSACTIONS_STREAM,
+                self._clean_transaction(transaction),
+                maxlen=10000  # Keep last 10k transactions
+            )
+    
+    @staticmethod
+    def _clean_transaction(transaction: dict) -> dict:
+        """Stringify values and filter out None values - Redis can't handle them"""
+        return {
+            k: str(v) for k, v in transaction.items() 
+            if v is not None
+        }
+    
     async def get_recent_transactions(self, count: int = 100) -> List[dict]:
         """Get recent transactions from stream"""
         if not self.is_connected:
@@ -105,19 +156,34 @@ class RedisService:
             return
         
         try:
-            await self.client.hset(self.METRICS_KEY, mapping={
-                k: json.dumps(v) if isinstance(v, (dict, list)) else str(v)
-                for k, v in metrics.items()
-            })
-            
-            # Also add to metrics stream for history
-            await self.client.xadd(
-                self.METRICS_STREAM,
-                {"data": json.dumps(metrics)},
-                maxlen=1000
-            )
+            async with self.client.pipeline(transaction=False) as pipe:
+                self._queue_metrics(pipe, metrics)
+                await self._execute(pipe)
         except Exception as e:
             print(f"Redis set_metrics error: {e}")
+            return
+        
+        for listener in self.metrics_listeners:
+            listener(metrics)
+    
+    def _queue_metrics(self, pipe, metrics: dict):
+        """Queue the metrics hash update, history entry and (throttled) publish"""
+        payload = self._dumps(metrics)
+        
+        # Every field JSON-encoded, so reads decode without sniffing types
+        pipe.hset(self.METRICS_KEY, mapping={
+            k: self._dumps(v) for k, v in metrics.items()
+        })
+        
+        # Also add to metrics stream for history
+        pipe.xadd(
+            self.METRICS_STREAM,
+            {"data": payload},
+            maxlen=1000
+        )
+        
+        if self._should_publish(self.METRICS_CHANNEL):
+            pipe.publish(self.METRICS_CHANNEL, payload)
     
     async def get_latest_metrics(self) -> Optional[dict]:
         """Get current metrics"""
@@ -126,18 +192,17 @@ class RedisService:
         
         try:
             data = await self.client.hgetall(self.METRICS_KEY)
-            if data:
-                return {
-                    k: float(v) if v.replace('.', '').replace('-', '').isdigit() 
-                    else json.loads(v) if v.startswith('{') or v.startswith('[')
-                    else v
-                    for k, v in data.items()
-                }
-            return None
+            return self._decode_metrics(data)
         except Exception as e:
             print(f"Redis get_metrics error: {e}")
             return None
     
+    def _decode_metrics(self, data: dict) -> Optional[dict]:
+        """Turn the JSON-encoded metrics hash back into typed values"""
+        if not data:
+            return None
+        return {k: self._loads(v) for k, v in data.items()}
+    
     async def get_metrics_history(self, count: int = 100) -> List[dict]:
         """Get metrics history"""
         if not self.is_connected:
@@ -148,11 +213,46 @@ class RedisService:
                 self.METRICS_STREAM,
                 count=count
             )
-            return [json.loads(entry[1].get("data", "{}")) for entry in entries]
+            return [self._loads(entry[1].get("data", "{}")) for entry in entries]
         except Exception as e:
             print(f"Redis get_metrics_history error: {e}")
             return []
     
+    # ============== Simulator Tick ==============
+    
+    async def write_tick(self, transactions: List[dict], metrics: dict, banks: Optional[List[dict]]):
+        """
+        Write one simulator tick - its transactions, the metrics sample and the
+        bank health snapshot (None = unchanged, skip it) - in a single pipelined round trip.
+        """
+        if not self.is_connected:
+            return
+        
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                self._queue_transactions(pipe, transactions)
+                self._queue_metrics(pipe, metrics)
+                if banks is not None:
+                    self._queue_bank_health(pipe, banks)
+                await self._execute(pipe)
+        except Exception as e:
+            print(f"Redis write_tick error: {e}")
+            return
+        
+        for listener in self.metrics_listeners:
+            listener(metrics)
+    
+    async def _execute(self, pipe) -> list:
+        """Execute a pipeline, tracking how many commands each round trip carries"""
+        self._pipeline_batches += 1
+        self._pipeline_commands += len(pipe)
+        return await pipe.execute()
+    
+    @property
+    def pipeline_avg_cmds(self) -> float:
+        """Average number of commands per pipelined write"""
+        return self._pipeline_commands / self._pipeline_batches if self._pipeline_batches else 0.0
+    
     # ============== Bank Health ==============
     
     async def set_bank_health(self, banks: List[dict]):
@@ -161,13 +261,19 @@ class RedisService:
             return
         
         try:
-            await self.client.set(
-                self.BANK_HEALTH_KEY,
-                json.dumps(banks)
-            )
+            async with self.client.pipeline(transaction=False) as pipe:
+                self._queue_bank_health(pipe, banks)
+                await self._execute(pipe)
         except Exception as e:
             print(f"Redis set_bank_health error: {e}")
     
+    def _queue_bank_health(self, pipe, banks: List[dict]):
+        """Queue the bank health snapshot and its (throttled) publish"""
+        payload = self._dumps(banks)
+        pipe.set(self.BANK_HEALTH_KEY, payload)
+        if self._should_publish(self.BANKS_CHANNEL):
+            pipe.publish(self.BANKS_CHANNEL, payload)
+    
     async def get_bank_health(self) -> Optional[List[dict]]:
         """Get current bank health"""
         if not self.is_connected:
@@ -175,11 +281,42 @@ class RedisService:
         
         try:
             data = await self.client.get(self.BANK_HEALTH_KEY)
-            return json.loads(data) if data else None
+            return self._loads(data) if data else None
         except Exception as e:
             print(f"Redis get_bank_health error: {e}")
             return None
     
+    # ============== Dashboard Pub/Sub ==============
+    
+    def _should_publish(self, channel: str) -> bool:
+        """Claim this channel's publish slot unless it published recently"""
+        now = time.monotonic()
+        if now - self._last_published.get(channel, float("-inf")) < self.publish_interval:
+            return False
+        self._last_published[channel] = now
+        return True
+    
+    async def get_dashboard_snapshot(self) -> tuple:
+        """Get current metrics and bank health in a single round trip"""
+        if not self.is_connected:
+            return None, None
+        
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.hgetall(self.METRICS_KEY)
+                pipe.get(self.BANK_HEALTH_KEY)
+                metrics, banks = await pipe.execute()
+            return self._decode_metrics(metrics), self._loads(banks) if banks else None
+        except Exception as e:
+            print(f"Redis get_dashboard_snapshot error: {e}")
+            return None, None
+    
+    async def subscribe_dashboard(self):
+        """Return a PubSub subscribed to the metrics and bank health channels"""
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.METRICS_CHANNEL, self.BANKS_CHANNEL)
+        return pubsub
+    
     # ============== Errors ==============
     
     async def add_error(self, error: dict):
@@ -187,11 +324,20 @@ class RedisService:
         if not self.is_connected:
             return
         
+        await self.add_errors_bulk([error])
+    
+    async def add_errors_bulk(self, errors: List[dict]):
+        """Add a batch of errors to the errors list in a single round trip"""
+        if not self.is_connected or not errors:
+            return
+        
         try:
-            await self.client.lpush("errors", json.dumps(error))
-            await self.client.ltrim("errors", 0, 999)  # Keep last 1000
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.lpush("errors", *(self._dumps(error) for error in errors))
+                pipe.ltrim("errors", 0, 999)  # Keep last 1000
+                await pipe.execute()
         except Exception as e:
-            print(f"Redis add_error error: {e}")
+            print(f"Redis add_errors_bulk error: {e}")
     
     async def get_recent_errors(self, count: int = 100) -> List[dict]:
         """Get recent errors"""
@@ -200,7 +346,7 @@ class RedisService:
         
         try:
             errors = await self.client.lrange("errors", 0, count - 1)
-            return [json.loads(e) for e in errors]
+            return [self._loads(e) for e in errors]
         except Exception as e:
             print(f"Redis get_errors error: {e}")
             return []
@@ -215,7 +361,7 @@ class RedisService:
         try:
             await self.client.hset(
                 f"{self.CONFIG_KEY}:banks",
-                mapping={k: json.dumps(v) for k, v in config.items()}
+                mapping={k: self._dumps(v) for k, v in config.items()}
             )
         except Exception as e:
             print(f"Redis set_bank_config error: {e}")
@@ -243,12 +389,29 @@ class RedisService:
         try:
             await self.client.xadd(
                 self.ALERTS_STREAM,
-                {"data": json.dumps(alert)},
+                {"data": self._dumps(alert)},
                 maxlen=500
             )
         except Exception as e:
             print(f"Redis add_alert error: {e}")
     
+    async def add_alerts_bulk(self, alerts: List[dict]):
+        """Add a batch of alerts in a single round trip"""
+        if not self.is_connected or not alerts:
+            return
+        
+        try:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for alert in alerts:
+                    pipe.xadd(
+                        self.ALERTS_STREAM,
+                        {"data": self._dumps(alert)},
+                        maxlen=500
+                    )
+                await pipe.execute()
+        except Exception as e:
+            print(f"Redis add_alerts_bulk error: {e}")
+    
     async def get_alerts(self, count: int = 50) -> List[dict]:
         """Get recent alerts"""
         if not self.is_connected:
@@ -259,7 +422,7 @@ class RedisService:
                 self.ALERTS_STREAM,
                 count=count
             )
-            return [json.loads(entry[1].get("data", "{}")) for entry in entries]
+            return [self._loads(entry[1].get("data", "{}")) for entry in entries]
         except Exception as e:
             print(f"Redis get_alerts error: {e}")
             return []
@@ -267,20 +430,68 @@ class RedisService:
     # ============== Memory ==============
     
     async def store_memory(self, memory: dict):
-        """Store agent memory"""
+        """Store agent memory, indexed by the anomaly types it covers"""
         if not self.is_connected:
             return
         
         try:
-            memory_id = f"mem_{datetime.now().timestamp()}"
-            await self.client.hset(
-                self.MEMORY_KEY,
-                memory_id,
-                json.dumps(memory)
-            )
+            # Capped stream: the oldest memories are trimmed away as new ones arrive
+            memory_id = await self._add_memory(self.client, memory)
+            anomaly_types = self._anomaly_types(memory.get("anomaly_pattern"))
+            if anomaly_types:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    self._queue_memory_index(pipe, memory, memory_id)
+                    await pipe.execute()
         except Exception as e:
             print(f"Redis store_memory error: {e}")
     
+    def _add_memory(self, client, memory: dict):
+        """XADD a memory to the capped stream (the oldest are trimmed as new ones arrive)"""
+        return client.xadd(
+            self.MEMORY_STREAM,
+            {"data": self._dumps(memory)},
+            maxlen=1000,
+            approximate=True
+        )
+    
+    def _queue_memory_index(self, pipe, memory: dict, memory_id: str):
+        """Queue SADDs indexing a memory id under each anomaly type it covers"""
+        for anomaly_type in self._anomaly_types(memory.get("anomaly_pattern")):
+            pipe.sadd(f"{self.MEMORY_TYPE_KEY}:{anomaly_type}", memory_id)
+    
+    async def _migrate_legacy_memories(self):
+        """
+        Move memories from the old agent:memory hash into the stream, oldest
+        first, and drop the old hash and its per-type id sets.
+        """
+        try:
+            # RENAME claims the hash, so only one worker migrates it
+            migrating = f"{self.LEGACY_MEMORY_KEY}:migrating"
+            try:
+                await self.client.rename(self.LEGACY_MEMORY_KEY, migrating)
+            except redis.ResponseError:
+                pass  # No legacy hash (or another worker took it)
+            
+            legacy = await self.client.hgetall(migrating)
+            if legacy:
+                # Ids are mem_<timestamp>: replay in the order they were stored
+                memory_ids = sorted(legacy, key=self._legacy_memory_time)
+                memories = [self._loads(legacy[m]) for m in memory_ids]
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for memory in memories:
+                        self._add_memory(pipe, memory)
+                    stream_ids = await pipe.execute()
+                async with self.client.pipeline(transaction=False) as pipe:
+                    for memory, stream_id in zip(memories, stream_ids):
+                        self._queue_memory_index(pipe, memory, stream_id)
+                    await pipe.execute()
+                print(f"Migrated {len(memories)} agent memories to {self.MEMORY_STREAM}")
+            
+            stale = [key async for key in self.client.scan_iter(match=f"{self.LEGACY_MEMORY_TYPE_KEY}:*")]
+            await self.client.delete(migrating, *stale)
+        except Exception as e:
+            print(f"Redis memory migration error: {e}")
+    
     async def get_similar_memories(self, pattern: dict, limit: int = 5) -> List[dict]:
         """
         Get similar memories (simplified without vector search).
@@ -290,23 +501,63 @@ class RedisService:
             return []
         
         try:
-            all_memories = await self.client.hgetall(self.MEMORY_KEY)
-            memories = [json.loads(v) for v in all_memories.values()]
+            # Simple matching by anomaly type, via the per-type id sets
+            pattern_types = self._anomaly_types(pattern.get("anomalies"))
+            if not pattern_types:
+                return []
+            type_keys = [f"{self.MEMORY_TYPE_KEY}:{t}" for t in pattern_types]
             
-            # Simple matching by anomaly type
-            pattern_types = set(a.get("type") for a in pattern.get("anomalies", []) if isinstance(a, dict))
+            async with self.client.pipeline(transaction=False) as pipe:
+                pipe.sunion(type_keys)
+                pipe.xrange(self.MEMORY_STREAM, count=1)
+                memory_ids, oldest = await pipe.execute()
+            if not oldest:
+                return []
             
-            matched = []
-            for mem in memories:
-                mem_types = set(a.get("type") for a in mem.get("anomaly_pattern", []) if isinstance(a, dict))
-                if pattern_types & mem_types:
-                    matched.append(mem)
+            # Ids older than the stream's oldest entry were trimmed, and anything
+            # that isn't a stream id is stale: drop both from the index
+            oldest_id = self._stream_id_key(oldest[0][0])
+            live, trimmed = [], []
+            for memory_id in memory_ids:
+                key = self._stream_id_key(memory_id)
+                (live if key is not None and key >= oldest_id else trimmed).append(memory_id)
             
-            return matched[:limit]
+            # Oldest first, as stored
+            live = sorted(live, key=self._stream_id_key)[:limit]
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in type_keys if trimmed else []:
+                    pipe.srem(key, *trimmed)
+                for memory_id in live:
+                    pipe.xrange(self.MEMORY_STREAM, min=memory_id, max=memory_id)
+                results = await pipe.execute()
+            
+            entries = results[len(results) - len(live):]
+            return [self._loads(entry[0][1]["data"]) for entry in entries if entry]
         except Exception as e:
             print(f"Redis get_memories error: {e}")
             return []
     
+    @staticmethod
+    def _legacy_memory_time(memory_id: str) -> float:
+        """Timestamp of a legacy mem_<ts> id (0 if malformed)"""
+        try:
+            return float(memory_id[4:])
+        except ValueError:
+            return 0.0
+    
+    @staticmethod
+    def _stream_id_key(stream_id: str) -> Optional[tuple]:
+        """Sortable (ms, seq) form of a stream entry id, or None if it isn't one"""
+        ms, _, seq = stream_id.partition("-")
+        if not ms.isdigit() or not (seq or "0").isdigit():
+            return None
+        return int(ms), int(seq or 0)
+    
+    @staticmethod
+    def _anomaly_types(anomalies: Optional[list]) -> set:
+        """Anomaly types present in a list of anomaly dicts"""
+        return set(a.get("type") for a in anomalies or [] if isinstance(a, dict))
+    
     # ============== Suppression ==============
     
     async def add_suppression(self, suppression: dict):
@@ -318,7 +569,7 @@ class RedisService:
             await self.client.hset(
                 "suppressions",
                 suppression["method"],
-                json.dumps(suppression)
+                self._dumps(suppression)
             )
         except Exception as e:
             print(f"Redis add_suppression error: {e}")
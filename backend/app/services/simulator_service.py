@@ -4,14 +4,20 @@ Generates realistic payment transactions for testing the agent
 """
 
 import asyncio
-import random
+import heapq
+import itertools
+import time
 from datetime import datetime
 from typing import Optional, List, Dict
 import json
+import numpy as np
 
 from app.services.redis_service import RedisService
 from app.models.schemas import Transaction, FailureScenario
 
+# Shared generator for the simulator's vectorized draws
+_rng = np.random.default_rng()
+
 
 class SimulatorService:
     """
@@ -26,7 +32,12 @@ class SimulatorService:
         self.task: Optional[asyncio.Task] = None
         
         # Configuration
-        self.transactions_per_second = 50
+        # One batch of batch_size transactions per tick_interval seconds
+        # (TPS = batch_size / tick_interval). A 1s tick matches the dashboard's
+        # publish interval and amortizes per-tick scheduling, aggregation and
+        # Redis dispatch over the whole batch.
+        self.batch_size = 50
+        self.tick_interval = 1.0
         self.base_success_rate = 97.5
         self.base_latency_ms = 200
         
@@ -55,14 +66,49 @@ class SimulatorService:
             "declined": ("400", "Transaction Declined"),
             "insufficient_funds": ("402", "Insufficient Funds")
         }
-        
-        # Active scenarios
-        self.active_scenarios: List[dict] = []
+        self._error_code_values = tuple(code for code, _ in self.error_codes.values())
+        
+        # Cumulative weight tables for bank / method draws (see _rebuild_weight_tables)
+        self._bank_keys: List[str] = []
+        self._bank_cum: np.ndarray = np.empty(0)
+        self._method_keys: List[str] = []
+        self._method_cum: np.ndarray = np.empty(0)
+        self._rebuild_weight_tables()
+        
+        # Active scenarios: min-heap of (end_time, seq, scenario_data), soonest to expire first
+        self._scenario_heap: List[tuple] = []
+        self._scenario_seq = itertools.count()
+        
+        # Scenario modifiers as arrays aligned with _bank_keys / _method_keys, plus
+        # the summed untargeted (global) failure increase; see _refresh_modifiers
+        self._bank_success_mod = np.zeros(len(self._bank_keys))
+        self._bank_latency_mod = np.zeros(len(self._bank_keys))
+        self._method_success_mod = np.zeros(len(self._method_keys))
+        self._global_success_modifier = 0.0
         
         # Metrics aggregation - larger window for better per-bank accuracy
-        self.metrics_window: List[dict] = []
         self.window_size = 200  # Increased for better per-bank statistics
         
+        # Bank health is only rewritten when it visibly changes, or every
+        # health_heartbeat seconds regardless
+        self.health_heartbeat = 5.0
+        self._last_health_key: Optional[tuple] = None
+        self._last_health_push = float("-inf")
+        
+        # The window is a ring buffer of parallel arrays (bank is an index into
+        # _bank_keys). Latency is kept in integer hundredths of a ms (it is
+        # rounded to 2dp), so the running totals below never drift.
+        self._win_success = np.zeros(self.window_size, dtype=np.bool_)
+        self._win_latency = np.zeros(self.window_size, dtype=np.int64)
+        self._win_bank = np.zeros(self.window_size, dtype=np.int8)
+        self._win_head = 0  # Next slot to write
+        self._win_count = 0
+        
+        # Per-bank totals over the window, updated as entries enter and leave
+        self._bank_success = np.zeros(len(self._bank_keys), dtype=np.int64)
+        self._bank_total = np.zeros(len(self._bank_keys), dtype=np.int64)
+        self._bank_latency = np.zeros(len(self._bank_keys), dtype=np.int64)
+        
         # Predefined scenarios
         self.scenarios = {
             "hdfc_timeout": FailureScenario(
@@ -98,6 +144,11 @@ class SimulatorService:
             )
         }
     
+    @property
+    def transactions_per_second(self) -> int:
+        """Simulated throughput implied by batch_size and tick_interval"""
+        return round(self.batch_size / self.tick_interval)
+    
     async def start(self):
         """Start the transaction simulator"""
         if self.is_running:
@@ -118,6 +169,18 @@ class SimulatorService:
                 pass
         print("🛑 Transaction simulator stopped")
     
+    @property
+    def active_scenarios(self) -> List[dict]:
+        """Currently active scenarios, soonest to expire first"""
+        return [entry[2] for entry in sorted(self._scenario_heap)]
+    
+    def _push_scenario(self, scenario_data: dict):
+        """Register an active scenario, keyed by when it expires"""
+        heapq.heappush(
+            self._scenario_heap,
+            (scenario_data["end_time"], next(self._scenario_seq), scenario_data)
+        )
+    
     async def run_if_enabled(self):
         """Run simulator if enabled by default"""
         await asyncio.sleep(2)  # Wait for other services
@@ -131,7 +194,7 @@ class SimulatorService:
         scenario = self.scenarios[scenario_name]
         
         # Apply scenario modifiers
-        end_time = datetime.now().timestamp() + scenario.duration_seconds
+        end_time = time.monotonic() + scenario.duration_seconds
         
         scenario_data = {
             "scenario": scenario,
@@ -139,7 +202,7 @@ class SimulatorService:
             "started_at": datetime.now().isoformat()
         }
         
-        self.active_scenarios.append(scenario_data)
+        self._push_scenario(scenario_data)
         
         # Apply modifiers to banks/methods
         if scenario.target_bank and scenario.target_bank in self.banks:
@@ -149,6 +212,7 @@ class SimulatorService:
         if scenario.target_method and scenario.target_method in self.payment_methods:
             self.payment_methods[scenario.target_method]["success_modifier"] = -scenario.failure_increase
         
+        self._refresh_modifiers()
         print(f"⚡ Triggered scenario: {scenario.description}")
         return True
     
@@ -170,7 +234,7 @@ class SimulatorService:
             duration_seconds=duration
         )
         
-        end_time = datetime.now().timestamp() + duration
+        end_time = time.monotonic() + duration
         
         scenario_data = {
             "scenario": scenario,
@@ -178,7 +242,7 @@ class SimulatorService:
             "started_at": datetime.now().isoformat()
         }
         
-        self.active_scenarios.append(scenario_data)
+        self._push_scenario(scenario_data)
         
         # Apply modifiers
         if bank != "ALL" and bank in self.banks:
@@ -189,49 +253,35 @@ class SimulatorService:
                 self.banks[b]["success_modifier"] = -failure_rate_increase / len(self.banks)
                 self.banks[b]["latency_modifier"] = latency_increase / 2
         
+        self._refresh_modifiers()
         print(f"💥 Custom scenario applied: {bank} +{failure_rate_increase}% failures, +{latency_increase}ms latency for {duration}s")
     
     async def _run_loop(self):
         """Main simulation loop"""
         while self.is_running:
             try:
+                # One timestamp for everything produced this tick
+                timestamp = datetime.now().isoformat()
+                
                 # Generate batch of transactions
-                batch_size = max(1, self.transactions_per_second // 10)
+                batch = self._generate_batch(max(1, self.batch_size))
                 
-                transactions = []
-                for _ in range(batch_size):
-                    txn = self._generate_transaction()
-                    transactions.append(txn)
-                    
-                    # Add to metrics window
-                    self.metrics_window.append({
-                        "success": txn["status"] == "success",
-                        "latency": txn["latency_ms"],
-                        "bank": txn["bank"]
-                    })
-                    
-                    # Keep window bounded
-                    if len(self.metrics_window) > self.window_size:
-                        self.metrics_window.pop(0)
+                # Add to metrics window
+                self._push_window(batch["success"], batch["latency"], batch["bank"])
                 
                 # Push to Redis
                 if self.redis.is_connected:
-                    for txn in transactions:
-                        await self.redis.add_transaction(txn)
-                    
-                    # Update metrics
-                    metrics = self._calculate_metrics()
-                    await self.redis.set_metrics(metrics)
-                    
-                    # Update bank health
-                    bank_health = self._calculate_bank_health()
-                    await self.redis.set_bank_health(bank_health)
+                    # Update metrics and bank health, then write the whole tick at once
+                    transactions = self._batch_transactions(batch, timestamp)
+                    metrics = self._calculate_metrics(timestamp)
+                    bank_health = self._changed_bank_health(timestamp)
+                    await self.redis.write_tick(transactions, metrics, bank_health)
                 
                 # Check for expired scenarios
                 self._cleanup_scenarios()
                 
                 # Sleep for interval
-                await asyncio.sleep(0.1)
+                await asyncio.sleep(self.tick_interval)
                 
             except asyncio.CancelledError:
                 break
@@ -239,114 +289,146 @@ class SimulatorService:
                 print(f"Simulator error: {e}")
                 await asyncio.sleep(1)
     
-    def _generate_transaction(self) -> dict:
-        """Generate a single transaction"""
-        # Select bank based on weights
-        bank = self._weighted_random(self.banks)
-        bank_config = self.banks[bank]
-        
-        # Select payment method
-        method = self._weighted_random(self.payment_methods)
-        method_config = self.payment_methods[method]
-        
-        # Calculate success rate with modifiers
-        success_rate = self.base_success_rate
-        success_rate += bank_config.get("success_modifier", 0)
-        success_rate += method_config.get("success_modifier", 0)
-        
-        # Apply any global modifiers from scenarios
-        for scenario_data in self.active_scenarios:
-            scenario = scenario_data["scenario"]
-            if not scenario.target_bank and not scenario.target_method:
-                success_rate -= scenario.failure_increase
-        
-        success_rate = max(0, min(100, success_rate))
+    def _generate_batch(self, count: int) -> Dict[str, np.ndarray]:
+        """Generate a batch of transactions as column arrays, one vectorized draw per field"""
+        # Select banks and payment methods based on weights
+        bank_idx = np.searchsorted(self._bank_cum, _rng.random(count) * self._bank_cum[-1])
+        method_idx = np.searchsorted(self._method_cum, _rng.random(count) * self._method_cum[-1])
+        
+        # Calculate success rate with modifiers (including global ones from scenarios)
+        success_rate = (
+            self.base_success_rate
+            + self._bank_success_mod[bank_idx]
+            + self._method_success_mod[method_idx]
+            - self._global_success_modifier
+        )
+        success_rate = np.clip(success_rate, 0, 100)
         
         # Determine success
-        is_success = random.random() * 100 < success_rate
-        
-        # Calculate latency
-        latency = self.base_latency_ms
-        latency += random.uniform(-50, 100)
-        latency += bank_config.get("latency_modifier", 0)
-        
-        if not is_success:
-            latency += random.uniform(100, 500)  # Failures take longer
+        is_success = _rng.random(count) * 100 < success_rate
         
-        latency = max(50, latency)
+        # Calculate latency (failures take longer)
+        latency = self.base_latency_ms + _rng.uniform(-50, 100, count) + self._bank_latency_mod[bank_idx]
+        latency += np.where(is_success, 0.0, _rng.uniform(100, 500, count))
+        latency = np.maximum(50, latency).round(2)
         
         # Generate error code if failed
-        error_code = None
-        if not is_success:
-            error_type = random.choice(list(self.error_codes.keys()))
-            error_code = self.error_codes[error_type][0]
+        error_idx = _rng.integers(0, len(self._error_code_values), count)
         
-        # Generate transaction
         return {
-            "id": f"txn_{random.randint(100000, 999999)}",
-            "amount": round(random.uniform(10, 5000), 2),
-            "currency": "INR",
-            "payment_method": method,
-            "bank": bank,
-            "status": "success" if is_success else "failed",
-            "error_code": error_code,
-            "latency_ms": round(latency, 2),
-            "timestamp": datetime.now().isoformat(),
-            "retry_count": 0
+            "id": _rng.integers(100000, 1000000, count),
+            "amount": _rng.uniform(10, 5000, count).round(2),
+            "method": method_idx,
+            "bank": bank_idx,
+            "success": is_success,
+            "error": error_idx,
+            "latency": latency,
         }
     
-    def _weighted_random(self, options: dict) -> str:
-        """Select randomly based on weights"""
-        total = sum(opt.get("weight", 1) for opt in options.values())
-        r = random.uniform(0, total)
-        
-        cumulative = 0
-        for key, opt in options.items():
-            cumulative += opt.get("weight", 1)
-            if r <= cumulative:
-                return key
-        
-        return list(options.keys())[0]
+    def _batch_transactions(self, batch: Dict[str, np.ndarray], timestamp: str) -> List[dict]:
+        """Transaction dicts for a generated batch"""
+        return [
+            {
+                "id": f"txn_{txn_id}",
+                "amount": amount,
+                "currency": "INR",
+                "payment_method": self._method_keys[m],
+                "bank": self._bank_keys[b],
+                "status": "success" if ok else "failed",
+                "error_code": None if ok else self._error_code_values[e],
+                "latency_ms": lat,
+                "timestamp": timestamp,
+                "retry_count": 0
+            }
+            for txn_id, amount, m, b, ok, e, lat in zip(
+                batch["id"].tolist(), batch["amount"].tolist(), batch["method"].tolist(),
+                batch["bank"].tolist(), batch["success"].tolist(), batch["error"].tolist(),
+                batch["latency"].tolist()
+            )
+        ]
+    
+    def _rebuild_weight_tables(self):
+        """
+        Precompute cumulative weights for bank and payment method selection.
+        Scenarios only touch modifiers; call this again after changing any weight.
+        """
+        self._bank_keys, self._bank_cum = self._cumulative_weights(self.banks)
+        self._method_keys, self._method_cum = self._cumulative_weights(self.payment_methods)
+    
+    @staticmethod
+    def _cumulative_weights(options: dict) -> tuple:
+        """Keys and running weight totals, for searchsorted-based weighted selection"""
+        keys = list(options)
+        cum = np.cumsum([options[key].get("weight", 1) for key in keys], dtype=float)
+        return keys, cum
     
-    def _calculate_metrics(self) -> dict:
-        """Calculate current metrics from window"""
-        if not self.metrics_window:
+    def _push_window(self, success: np.ndarray, latency: np.ndarray, bank: np.ndarray):
+        """Append a batch to the metrics ring buffer, keeping the running totals in step"""
+        size = self.window_size
+        
+        # Only the newest window_size entries can survive in the window
+        success, latency, bank = success[-size:], latency[-size:], bank[-size:]
+        latency = np.rint(latency * 100).astype(np.int64)
+        
+        slots = (self._win_head + np.arange(len(bank))) % size
+        # Slots holding an entry start size - count slots after the head: evict those
+        evicted = slots[size - self._win_count:]
+        if len(evicted):
+            self._update_totals(
+                self._win_success[evicted], self._win_latency[evicted], self._win_bank[evicted], -1
+            )
+        
+        self._win_success[slots] = success
+        self._win_latency[slots] = latency
+        self._win_bank[slots] = bank
+        self._update_totals(success, latency, bank, 1)
+        
+        self._win_head = (self._win_head + len(bank)) % size
+        self._win_count = min(size, self._win_count + len(bank))
+    
+    def _update_totals(self, success: np.ndarray, latency: np.ndarray, bank: np.ndarray, sign: int):
+        """Add (sign=1) or remove (sign=-1) window entries from the per-bank totals"""
+        n_banks = len(self._bank_keys)
+        self._bank_total += sign * np.bincount(bank, minlength=n_banks)
+        self._bank_success += sign * np.bincount(bank, weights=success, minlength=n_banks).astype(np.int64)
+        self._bank_latency += sign * np.bincount(bank, weights=latency, minlength=n_banks).astype(np.int64)
+    
+    def _calculate_metrics(self, timestamp: Optional[str] = None) -> dict:
+        """Calculate current metrics from window (timestamped now unless given the tick's)"""
+        timestamp = timestamp or datetime.now().isoformat()
+        if not self._win_count:
             return {
                 "success_rate": self.base_success_rate,
                 "avg_latency": self.base_latency_ms,
                 "transaction_volume": self.transactions_per_second * 60,
                 "error_rate": 100 - self.base_success_rate,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": timestamp
             }
         
-        successes = sum(1 for m in self.metrics_window if m["success"])
-        success_rate = (successes / len(self.metrics_window)) * 100
+        success_rate = (int(self._bank_success.sum()) / self._win_count) * 100
         
-        avg_latency = sum(m["latency"] for m in self.metrics_window) / len(self.metrics_window)
+        avg_latency = int(self._bank_latency.sum()) / 100 / self._win_count
         
         return {
             "success_rate": round(success_rate, 2),
             "avg_latency": round(avg_latency, 2),
             "transaction_volume": self.transactions_per_second * 60,
             "error_rate": round(100 - success_rate, 2),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": timestamp
         }
     
-    def _calculate_bank_health(self) -> List[dict]:
+    def _calculate_bank_health(self, timestamp: Optional[str] = None) -> List[dict]:
         """Calculate health for each bank - isolated per-bank metrics"""
-        bank_metrics = {bank: {"success": 0, "total": 0, "latency": []} for bank in self.banks}
-        
-        for m in self.metrics_window:
-            bank = m.get("bank")
-            if bank in bank_metrics:
-                bank_metrics[bank]["total"] += 1
-                if m["success"]:
-                    bank_metrics[bank]["success"] += 1
-                bank_metrics[bank]["latency"].append(m["latency"])
-        
+        timestamp = timestamp or datetime.now().isoformat()
         health = []
-        for bank, config in self.banks.items():
-            metrics = bank_metrics[bank]
+        for bank, successes, total, latency in zip(
+            self._bank_keys,
+            self._bank_success.tolist(),
+            self._bank_total.tolist(),
+            self._bank_latency.tolist()
+        ):
+            config = self.banks[bank]
+            metrics = {"success": successes, "total": total, "latency": latency}
             
             # Get the current success modifier for this specific bank
             bank_success_modifier = config.get("success_modifier", 0)
@@ -363,11 +445,11 @@ class SimulatorService:
                 # Weight more toward expected when we have fewer samples
                 weight = metrics["total"] / 5
                 success_rate = (measured_rate * weight) + (expected_rate * (1 - weight))
-                avg_latency = sum(metrics["latency"]) / len(metrics["latency"]) if metrics["latency"] else self.base_latency_ms
+                avg_latency = metrics["latency"] / 100 / metrics["total"]
             else:
                 # Enough samples - use measured values
                 success_rate = (metrics["success"] / metrics["total"]) * 100
-                avg_latency = sum(metrics["latency"]) / len(metrics["latency"]) if metrics["latency"] else self.base_latency_ms
+                avg_latency = metrics["latency"] / 100 / metrics["total"]
             
             # Determine status
             status = "healthy"
@@ -383,23 +465,46 @@ class SimulatorService:
                 "success_rate": round(success_rate, 2),
                 "avg_latency": round(avg_latency, 2),
                 "weight": config["weight"],
-                "last_updated": datetime.now().isoformat()
+                "last_updated": timestamp
             }
             
-            # Enrich with ML predictions if available
-            if self.ml:
-                predictions = self.ml.get_bank_risk_scores()
-                bank_data["predicted_failure_probability"] = predictions.get(bank, 0.0)
-            
             health.append(bank_data)
         
         return health
     
+    def _changed_bank_health(self, timestamp: str) -> Optional[List[dict]]:
+        """
+        Bank health to publish this tick, or None if no bank visibly changed
+        (0.1 precision, same status) since the last publish and the heartbeat
+        hasn't come due. Unchanged ticks also skip the ML enrichment.
+        """
+        health = self._calculate_bank_health(timestamp)
+        
+        key = tuple(
+            (round(b["success_rate"], 1), round(b["avg_latency"], 1), b["status"])
+            for b in health
+        )
+        now = time.monotonic()
+        if key == self._last_health_key and now - self._last_health_push < self.health_heartbeat:
+            return None
+        self._last_health_key = key
+        self._last_health_push = now
+        
+        # Enrich with ML predictions if available (one batched predict + SHAP pass)
+        if self.ml:
+            for bank_data, (risk, reason) in zip(health, self.ml.get_bank_risk_list(health)):
+                bank_data["predicted_failure_probability"] = risk
+                bank_data["ml_reason"] = reason
+        
+        return health
+    
     def _cleanup_scenarios(self):
         """Remove expired scenarios"""
-        now = datetime.now().timestamp()
+        now = time.monotonic()
         
-        expired = [s for s in self.active_scenarios if s["end_time"] < now]
+        expired = []
+        while self._scenario_heap and self._scenario_heap[0][0] < now:
+            expired.append(heapq.heappop(self._scenario_heap)[2])
         
         for scenario_data in expired:
             scenario = scenario_data["scenario"]
@@ -414,4 +519,21 @@ class SimulatorService:
             
             print(f"✅ Scenario ended: {scenario.name}")
         
-        self.active_scenarios = [s for s in self.active_scenarios if s["end_time"] >= now]
+        if expired:
+            self._refresh_modifiers()
+    
+    def _refresh_modifiers(self):
+        """Snapshot bank/method modifiers and the global failure increase after a scenario change"""
+        self._bank_success_mod = np.array(
+            [self.banks[b].get("success_modifier", 0) for b in self._bank_keys], dtype=float
+        )
+        self._bank_latency_mod = np.array(
+            [self.banks[b].get("latency_modifier", 0) for b in self._bank_keys], dtype=float
+        )
+        self._method_success_mod = np.array(
+            [self.payment_methods[m].get("success_modifier", 0) for m in self._method_keys], dtype=float
+        )
+        self._global_success_modifier = sum(
+            s["scenario"].failure_increase for s in self.active_scenarios
+            if not s["scenario"].target_bank and not s["scenario"].target_method
+        )
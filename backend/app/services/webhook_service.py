@@ -1,10 +1,19 @@
 
 import httpx
 import asyncio
+import itertools
 import os
-from typing import Dict, Any
+import time
+import orjson
+from typing import Dict, Any, List, Optional, Set
 import structlog
-from datetime import datetime
+
+# Optional: HTTP/2 multiplexing needs the h2 package (httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 logger = structlog.get_logger()
 
@@ -16,7 +25,29 @@ class WebhookService:
     def __init__(self):
         # In a real system, this would be loaded from DB per merchant
         self.default_webhook_url = os.getenv("MERCHANT_WEBHOOK_URL", "http://localhost:9000/webhook")
-        self.client = httpx.AsyncClient(timeout=5.0)
+        self.client = httpx.AsyncClient(
+            timeout=5.0,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_connections=200, max_keepalive_connections=50)
+        )
+        
+        # Cap concurrent deliveries; in-flight tasks are tracked so they can't be GC'd
+        self._send_slots = asyncio.Semaphore(64)
+        self._tasks: Set[asyncio.Task] = set()
+        
+        # Events are queued and drained in batches of up to batch_max, waiting at
+        # most batch_wait seconds to fill one. With MERCHANT_WEBHOOK_BATCH_URL set,
+        # a batch is one POST of {"events": [...]}; otherwise its events are
+        # POSTed to default_webhook_url concurrently.
+        self.batch_webhook_url = os.getenv("MERCHANT_WEBHOOK_BATCH_URL")
+        self.batch_max = 100
+        self.batch_wait = 0.05
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._drain_task: Optional[asyncio.Task] = None
+        
+        # Event ids: one clock read plus a counter, unique even within a nanosecond
+        self._event_seq = itertools.count()
+        self._json_headers = {"Content-Type": "application/json"}
         
     async def dispatch_event(self, event_type: str, payload: Dict[str, Any]):
         """
@@ -26,13 +57,14 @@ class WebhookService:
             event_type: e.g., 'payment.success', 'payment.failed'
             payload: The data associated with the event
         """
-        event_id = f"evt_{datetime.now().timestamp()}"
+        now_ns = time.time_ns()
+        event_id = f"evt_{now_ns}_{next(self._event_seq)}"
         
         webhook_payload = {
             "id": event_id,
             "object": "event",
             "type": event_type,
-            "created": int(datetime.now().timestamp()),
+            "created": now_ns // 1_000_000_000,
             "data": {
                 "object": payload
             }
@@ -41,17 +73,61 @@ class WebhookService:
         logger.info(f"🚀 Dispatching webhook: {event_type} to {self.default_webhook_url}")
         
         # Fire and forget (or retry queue in prod)
-        asyncio.create_task(self._send_request(self.default_webhook_url, webhook_payload))
+        if self._drain_task is None or self._drain_task.done():
+            self._drain_task = asyncio.create_task(self._drain_loop())
+        self._queue.put_nowait(webhook_payload)
+    
+    async def _drain_loop(self):
+        """Collect queued events into batches and hand each batch off for delivery"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.batch_max:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            
+            task = asyncio.create_task(self._deliver(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            for _ in batch:
+                self._queue.task_done()
+    
+    async def _deliver(self, events: List[Dict]):
+        """Deliver a batch of events, as one request if a batch endpoint is configured"""
+        if self.batch_webhook_url:
+            await self._send_request(
+                self.batch_webhook_url, {"events": events}, f"batch of {len(events)} events"
+            )
+        else:
+            await asyncio.gather(*(
+                self._send_request(self.default_webhook_url, event, event["type"])
+                for event in events
+            ))
         
-    async def _send_request(self, url: str, payload: Dict):
+    async def _send_request(self, url: str, payload: Dict, description: str):
         try:
-            resp = await self.client.post(url, json=payload)
+            async with self._send_slots:
+                resp = await self.client.post(
+                    url, content=orjson.dumps(payload), headers=self._json_headers
+                )
             if resp.status_code >= 200 and resp.status_code < 300:
-                logger.info(f"✅ Webhook delivered: {payload['type']}")
+                logger.info(f"✅ Webhook delivered: {description}")
             else:
                 logger.warn(f"⚠️ Webhook failed: {resp.status_code} - {resp.text}")
         except Exception as e:
             logger.error(f"❌ Webhook dispatch error: {str(e)}")
 
     async def close(self):
+        # Hand off whatever is still queued, then let in-flight deliveries
+        # finish before the pool goes away
+        if self._drain_task:
+            await self._queue.join()
+            self._drain_task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
         await self.client.aclose()
@@ -96,9 +96,19 @@ export default function WarRoomDashboard() {
         case "metrics":
           setMetrics(data.data);
           break;
+        case "metrics.delta":
+          setMetrics((prev) => ({ ...prev, ...data.data }));
+          break;
         case "banks":
           setBanks(data.data);
           break;
+        case "banks.delta": {
+          const changed = new Map<string, BankHealth>(
+            data.data.map((bank: BankHealth) => [bank.name, bank])
+          );
+          setBanks((prev) => prev.map((bank) => changed.get(bank.name) ?? bank));
+          break;
+        }
         case "intervention":
           const intervention = {
             ...data.data,
@@ -1,5 +1,6 @@
 
 import asyncio
+import csv
 import sys
 import os
 import logging
@@ -10,14 +11,17 @@ sys.path.append(os.path.join(os.getcwd(), "backend"))
 from app.services.ml_service import MLService
 from app.agent.tools import PaymentOpsTools
 
-# Mock Redis
+# Mock Redis (canned responses, copied per call since callers enrich them in place)
 class MockRedis:
+    METRICS = {"success_rate": 98.0, "avg_latency": 150, "error_rate": 2.0}
+    BANK_HEALTH = [{"name": "HDFC", "status": "healthy"}, {"name": "ICICI", "status": "healthy"}]
+    
     def __init__(self):
         self.is_connected = True
     async def get_latest_metrics(self):
-        return {"success_rate": 98.0, "avg_latency": 150, "error_rate": 2.0}
+        return dict(self.METRICS)
     async def get_bank_health(self):
-        return [{"name": "HDFC", "status": "healthy"}, {"name": "ICICI", "status": "healthy"}]
+        return [dict(bank) for bank in self.BANK_HEALTH]
     async def get_similar_memories(self, *args):
         return []
 
@@ -32,14 +36,13 @@ async def verify_ml():
     if not os.path.exists(ml_service.data_path):
         print(f"Creating dummy data at {ml_service.data_path}")
         os.makedirs(os.path.dirname(ml_service.data_path), exist_ok=True)
-        with open(ml_service.data_path, "w") as f:
-            f.write("timestamp,bank,payment_method,amount,status,latency_ms,retry_count,error_code\n")
-            # Add some dummy rows
-            for i in range(100):
-                f.write(f"2023-01-01 10:00:{i%60},HDFC,upi,1000,success,150,0,\n")
-            # Add some failures
-            for i in range(20):
-                 f.write(f"2023-01-01 10:05:{i%60},HDFC,upi,1000,failed,500,2,504\n")
+        rows = [("timestamp", "bank", "payment_method", "amount", "status", "latency_ms", "retry_count", "error_code")]
+        # Add some dummy rows
+        rows.extend((f"2023-01-01 10:00:{i%60}", "HDFC", "upi", 1000, "success", 150, 0, "") for i in range(100))
+        # Add some failures
+        rows.extend((f"2023-01-01 10:05:{i%60}", "HDFC", "upi", 1000, "failed", 500, 2, 504) for i in range(20))
+        with open(ml_service.data_path, "w", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerows(rows)
     
     await ml_service.train_model()
     